@@ -10,6 +10,38 @@
 
  const PYTHON_API_BASE_URL = "http://localhost:5001/api"; // Define base URL for Python API
 
+ // When the Python API keeps each user's expenses separately it needs to know who is
+ // asking: calls then carry a short-lived token from /api/finance-token, reused until it
+ // expires. Without FINANCE_API_SECRET there is no token and calls go out as plain fetches.
+ const NO_TOKEN_RECHECK_SECONDS = 300;
+ // Longest the dashboard waits on one CSV import before giving up polling
+ const MAX_IMPORT_POLL_MS = 15 * 60 * 1000;
+ let financeToken = null;
+ const getFinanceToken = async () => {
+   if (!financeToken || financeToken.expires_at - 60 < Date.now() / 1000) {
+     try {
+       const res = await fetch("/api/finance-token");
+       const data = res.ok ? await res.json() : {};
+       financeToken = data.token
+         ? data
+         : { token: null, expires_at: Date.now() / 1000 + NO_TOKEN_RECHECK_SECONDS };
+       if (!res.ok) console.error(`Could not get an API token (status ${res.status})`);
+     } catch (error) {
+       console.error("Could not get an API token:", error);
+       return null; // Try again on the next call
+     }
+   }
+   return financeToken.token;
+ };
+
+ const apiFetch = async (url, options = {}) => {
+   const token = await getFinanceToken();
+   if (!token) return fetch(url, options);
+   const headers = new Headers(options.headers);
+   headers.set("Authorization", `Bearer ${token}`);
+   return fetch(url, { ...options, headers });
+ };
+
 
  export default function HomePage() {
    const { data: session, status } = useSession();
@@ -85,12 +117,35 @@
     formData.append('file', selectedFile); // 'file' must match the key expected by Flask
 
     try {
-        const response = await fetch(`${PYTHON_API_BASE_URL}/expenses/upload_csv`, {
+        const response = await apiFetch(`${PYTHON_API_BASE_URL}/expenses/upload_csv`, {
             method: 'POST',
             body: formData,
         });
 
-        const data = await response.json();
+        let data = await response.json();
+
+        // The import runs in the background: poll its job until it finishes
+        if (response.status === 202 && data.job_id) {
+            setUploadMessage({ type: 'info', text: 'Importing...' });
+            const pollDeadline = Date.now() + MAX_IMPORT_POLL_MS;
+            while (data.status === 'queued' || data.status === 'running') {
+                if (Date.now() > pollDeadline) {
+                    setUploadMessage({ type: 'error', text: 'The import is taking too long. Refresh later to see whether it finished.' });
+                    return;
+                }
+                await new Promise((resolve) => setTimeout(resolve, 1000));
+                const jobResponse = await apiFetch(`${PYTHON_API_BASE_URL}/import_jobs/${data.job_id}`);
+                data = await jobResponse.json();
+                if (!jobResponse.ok) break;
+                if (data.status === 'running') {
+                    setUploadMessage({ type: 'info', text: `Importing... ${data.progress.percent}%` });
+                }
+            }
+            if (data.status !== 'completed') {
+                setUploadMessage({ type: 'error', text: data.message || data.error || 'Import failed.' });
+                return;
+            }
+        }
 
         if (response.ok) {
             setUploadMessage({ type: 'success', text: data.message || 'File uploaded and expenses added successfully!' });
@@ -153,7 +208,7 @@
 
    const fetchExpenses = async () => {
      try {
-       const res = await fetch(`${PYTHON_API_BASE_URL}/expenses`);
+       const res = await apiFetch(`${PYTHON_API_BASE_URL}/expenses`);
        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
        const data = await res.json();
        setExpenses(Array.isArray(data) ? data : []);
@@ -166,7 +221,7 @@
 
    const fetchInsightsSummary = async () => {
      try {
-       const res = await fetch(`${PYTHON_API_BASE_URL}/insights/summary`);
+       const res = await apiFetch(`${PYTHON_API_BASE_URL}/insights/summary`);
        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
        const data = await res.json();
        setInsightsSummary(data);
@@ -177,7 +232,7 @@
 
    const fetchCategorySpending = async () => {
      try {
-       const res = await fetch(`${PYTHON_API_BASE_URL}/insights/spending_by_category`);
+       const res = await apiFetch(`${PYTHON_API_BASE_URL}/insights/spending_by_category`);
        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
        const data = await res.json();
        setCategorySpending(data);
@@ -189,7 +244,7 @@
 
    const fetchMonthlySpending = async () => {
      try {
-       const res = await fetch(`${PYTHON_API_BASE_URL}/insights/monthly_spending`);
+       const res = await apiFetch(`${PYTHON_API_BASE_URL}/insights/monthly_spending`);
        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
        const data = await res.json();
        setMonthlySpending(data);
@@ -201,7 +256,7 @@
 
    const fetchPrediction = async () => {
      try {
-       const res = await fetch(`${PYTHON_API_BASE_URL}/predict/next_month_total`);
+       const res = await apiFetch(`${PYTHON_API_BASE_URL}/predict/next_month_total`);
        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
        const data = await res.json();
        setPrediction(data);
@@ -223,7 +278,7 @@
          return;
      }
      try {
-         const res = await fetch(`${PYTHON_API_BASE_URL}/expenses`, {
+         const res = await apiFetch(`${PYTHON_API_BASE_URL}/expenses`, {
              method: 'POST',
              headers: { 'Content-Type': 'application/json' },
              body: JSON.stringify({ ...newExpense, amount: parseFloat(newExpense.amount) }),
@@ -0,0 +1,29 @@
+import crypto from "crypto";
+import { getToken } from "next-auth/jwt";
+
+// Lifetime of the tokens issued here (seconds)
+const TOKEN_TTL_SECONDS = 3600;
+
+// Issues the signed-in user a token for the Python finance API, when it keeps each
+// user's expenses separately. Same format as python_finance_api/auth.py:
+// base64url({"sub","exp"}) + "." + base64url(HMAC-SHA256(FINANCE_API_SECRET, payload)).
+// Without FINANCE_API_SECRET the API runs with one shared store and needs no token:
+// the response is then { token: null }.
+export default async function handler(req, res) {
+  if (req.method !== "GET") {
+    return res.status(405).json({ error: "Method not allowed" });
+  }
+  const session = await getToken({ req, secret: process.env.NEXTAUTH_SECRET });
+  if (!session?.sub) {
+    return res.status(401).json({ error: "Not signed in" });
+  }
+  if (!process.env.FINANCE_API_SECRET) {
+    return res.status(200).json({ token: null, expires_at: null });
+  }
+
+  const expiresAt = Math.floor(Date.now() / 1000) + TOKEN_TTL_SECONDS;
+  const payload = Buffer.from(JSON.stringify({ sub: String(session.sub), exp: expiresAt })).toString("base64url");
+  const signature = crypto.createHmac("sha256", process.env.FINANCE_API_SECRET).update(payload).digest("base64url");
+  res.setHeader("Cache-Control", "no-store");
+  res.status(200).json({ token: `${payload}.${signature}`, expires_at: expiresAt });
+}
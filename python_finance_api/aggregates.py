@@ -0,0 +1,89 @@
+import threading
+
+from metrics import phase
+from storage import iso_months
+
+
+class ExpenseAggregates:
+    """Running totals behind the /api/insights/* endpoints.
+
+    Holds the overall total and count plus per-category, per-month and
+    per-(category, month) totals for one store. New expenses written by this
+    process are added in place; the totals are rebuilt from the store (using its
+    own aggregation) only when the store's version shows a change this process
+    didn't make, e.g. on startup, another worker's write or an edit to the data
+    file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None  # Store version the totals correspond to; None = not built
+        self.total = 0.0
+        self.count = 0
+        self.by_category = {}
+        self.by_month = {}  # 'YYYY-MM' -> total
+        self.by_category_month = {}  # (category, 'YYYY-MM') -> total
+        self.rebuilds = 0
+
+    # Returns the up-to-date totals as a dict, rebuilding them first if the store
+    # changed behind our back
+    def snapshot(self, store):
+        with self._lock:
+            self._refresh(store)
+            return {
+                'total': self.total,
+                'count': self.count,
+                'by_category': dict(self.by_category),
+                'by_month': {month: self.by_month[month] for month in sorted(self.by_month)},
+            }
+
+    # Returns (version, {(category, 'YYYY-MM'): total}) for the forecasting engine.
+    # The copy is skipped (None) when the caller already has the totals for `known_version`.
+    def category_month_totals(self, store, known_version=None):
+        with self._lock:
+            self._refresh(store)
+            if known_version is not None and known_version == self.version:
+                return self.version, None
+            return self.version, dict(self.by_category_month)
+
+    def _refresh(self, store):
+        current = store.version()
+        if self.version is None or self.version != current:
+            with phase('aggregate_rebuild'):
+                self._rebuild(store, current)
+
+    # `version` is read before the store is queried, so a write that lands during the
+    # rebuild leaves the totals marked as older than the store and they are rebuilt again
+    def _rebuild(self, store, version):
+        summary = store.summary()
+        self.total, self.count = summary['total'], summary['count']
+        self.by_category = store.totals_by_category()
+        self.by_month = store.totals_by_month()
+        self.by_category_month = store.totals_by_category_month()
+        self.version = version
+        self.rebuilds += 1
+
+    # Folds newly appended typed rows into the totals. `before`/`after` are the store
+    # versions around the append; if the totals weren't at `before`, they can't be
+    # patched and are left for the next snapshot to rebuild.
+    def apply(self, df, before, after):
+        with self._lock:
+            if self.version is None or self.version != before:
+                self.version = None
+                return
+            if len(df):
+                amounts = df['amount'].astype(float)
+                self.total += float(amounts.sum())
+                self.count += len(df)
+                for category, total in amounts.groupby(df['category']).sum().items():
+                    self.by_category[category] = self.by_category.get(category, 0.0) + float(total)
+                months = iso_months(df['date'])
+                for month, total in amounts.groupby(months).sum().items():
+                    self.by_month[month] = self.by_month.get(month, 0.0) + float(total)
+                for key, total in amounts.groupby([df['category'], months]).sum().items():
+                    self.by_category_month[key] = self.by_category_month.get(key, 0.0) + float(total)
+            self.version = after
+
+    def stats(self):
+        with self._lock:
+            return {'rebuilds': self.rebuilds, 'count': self.count, 'built': self.version is not None}
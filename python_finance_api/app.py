@@ -1,88 +1,213 @@
-import pandas as pd
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request
 from flask_cors import CORS # Import CORS
-from datetime import datetime
 import os
-import numpy as np # For numerical operations
-from sklearn.linear_model import LinearRegression # For ML prediction
+import threading
 import uuid # For generating unique IDs
-from werkzeug.utils import secure_filename # For secure file uploads
+import hashlib
+from functools import wraps
+from metrics import RequestMetrics, phase, timed_chunks
 
-
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app) # Enable CORS for all routes, allowing requests from your Next.js app
+# pandas, numpy and the storage/forecasting modules built on them are imported on first
+# use (or when the data is preloaded), so creating the app and serving /api/health
+# stay cheap
 
 # Define the path for the CSV file
 # --- Configuration ---
 DATA_FILE = 'expenses.csv'
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 CSV_PATH = os.path.join(BASE_DIR, DATA_FILE)
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 ALLOWED_EXTENSIONS = {'csv'}
+# Largest page GET /api/expenses returns when paginating (?limit= / ?cursor=)
+MAX_PAGE_SIZE = 1000
+
+
+# Helper function to read an optional whole-number setting from the environment
+def env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+# Default app configuration, overridable through the environment or create_app(config).
+# Settings left as None take their module's default when first used (jobs.IMPORT_WORKERS,
+# state.MAX_OPEN_PARTITIONS), so those modules aren't imported here.
+def default_config():
+    # Storage backend: 'csv' (expenses.csv), 'sqlite' or 'parquet'.
+    # Convert existing data first with: python -m storage migrate --to <backend>
+    backend = os.environ.get('EXPENSE_STORAGE_BACKEND', 'csv')
+    return {
+        'STORAGE_BACKEND': backend,
+        'STORAGE_PATH': os.environ.get('EXPENSE_STORAGE_PATH') or (CSV_PATH if backend == 'csv' else None),
+        'BASE_DIR': BASE_DIR,
+        # Load the expenses and build the insight totals in create_app() instead of on
+        # the first request; with gunicorn's preload_app the forked workers share them
+        'PRELOAD_DATA': os.environ.get('EXPENSE_PRELOAD', '0') == '1',
+        # Where background CSV imports keep their status files and spooled uploads,
+        # and how many run at once per worker process
+        'IMPORT_JOBS_DIR': os.environ.get('EXPENSE_IMPORT_JOBS_DIR') or os.path.join(BASE_DIR, 'import_jobs'),
+        'IMPORT_WORKERS': env_int('EXPENSE_IMPORT_WORKERS'),
+        # Directory where worker processes share their request metrics; unset, /api/metrics
+        # only covers the process that answers it
+        'METRICS_DIR': os.environ.get('EXPENSE_METRICS_DIR'),
+        # Per-user storage: every route except /api/health and /api/metrics then needs an
+        # 'Authorization: Bearer <token>' header signed with AUTH_SECRET (see auth.py), and
+        # reads and writes only that user's partition under PARTITIONS_DIR, optionally in
+        # the hash-sharded layout. Split existing data first with: python -m storage split
+        'USER_PARTITIONS': os.environ.get('EXPENSE_USER_PARTITIONS', '0') == '1',
+        'AUTH_SECRET': os.environ.get('FINANCE_API_SECRET'),
+        'PARTITIONS_DIR': os.environ.get('EXPENSE_PARTITIONS_DIR') or os.path.join(BASE_DIR, 'users'),
+        'PARTITION_SHARDED': os.environ.get('EXPENSE_PARTITION_SHARDED', '0') == '1',
+        'MAX_OPEN_PARTITIONS': env_int('EXPENSE_MAX_OPEN_PARTITIONS'),
+    }
+
+
+api = Blueprint('api', __name__)
+_extensions_lock = threading.Lock()
+# Endpoints served without a user token: they don't touch anyone's expenses
+PUBLIC_ENDPOINTS = {'api.health', 'api.get_metrics'}
+
 
-# Create upload folder if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Application factory: python app.py, flask --app app run and wsgi.py all go through here
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_mapping(default_config())
+    if config:
+        app.config.update(config)
+    if app.config['USER_PARTITIONS'] and not app.config['AUTH_SECRET']:
+        raise RuntimeError('USER_PARTITIONS needs AUTH_SECRET (FINANCE_API_SECRET) to authenticate users')
+    CORS(app, expose_headers=['ETag', 'X-Next-Cursor']) # Enable CORS for all routes, allowing requests from your Next.js app
+    app.register_blueprint(api)
+    # Per-route request latency and phase timings, served at /api/metrics
+    metrics = app.extensions['metrics'] = RequestMetrics(app.config['METRICS_DIR'])
+    metrics.init_app(app)
+    if app.config['PRELOAD_DATA']:
+        with app.app_context():
+            if app.config['USER_PARTITIONS']:
+                get_user_states().warm()
+            else:
+                get_state().warm()
+    return app
 
 # --- Helper Functions ---
 
+# Helper function to get one of the app's lazily created objects, calling
+# `factory(config)` the first time it is needed
+def app_extension(name, factory):
+    extension = current_app.extensions.get(name)
+    if extension is None:
+        with _extensions_lock:
+            extension = current_app.extensions.get(name)
+            if extension is None:
+                extension = current_app.extensions[name] = factory(current_app.config)
+    return extension
+
+# Helper function to get the ExpenseState (store, insight totals, forecasts) the current
+# request works on: the authenticated user's with per-user storage, else the shared one
+def get_state():
+    if current_app.config['USER_PARTITIONS']:
+        return get_user_states().get(g.user_id)
+    from state import ExpenseState
+    return app_extension('expenses', ExpenseState.from_config)
+
+# Helper function to get the per-user states (USER_PARTITIONS only)
+def get_user_states():
+    from state import UserStates
+    return app_extension('user_states', UserStates.from_config)
+
+# Helper function to get the app's background import jobs
+def get_import_jobs():
+    from jobs import IMPORT_WORKERS, ImportJobs
+    return app_extension('import_jobs', lambda config: ImportJobs(
+        config['IMPORT_JOBS_DIR'], config['IMPORT_WORKERS'] or IMPORT_WORKERS))
+
+# With per-user storage, every request (bar the public endpoints and CORS preflights)
+# must carry a valid user token; the user's id is kept in g.user_id
+@api.before_request
+def authenticate():
+    if not current_app.config['USER_PARTITIONS'] or request.method == 'OPTIONS' \
+            or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    from auth import user_from_authorization
+    from storage import validate_user_id
+    try:
+        user_id = user_from_authorization(request.headers.get('Authorization'), current_app.config['AUTH_SECRET'])
+        g.user_id = validate_user_id(user_id) # Becomes a file name
+    except ValueError as e: # AuthError included
+        response = jsonify({'error': f'Authentication required: {e}'})
+        response.status_code = 401
+        response.headers['WWW-Authenticate'] = 'Bearer'
+        return response
+
 # Helper function to load expenses
+# The returned DataFrame may share its data with the store's cache; treat it as read-only
 def load_expenses():
-    if not os.path.exists(CSV_PATH):
-        df = pd.DataFrame(columns=['id', 'date', 'category', 'amount', 'description'])
-        df.to_csv(CSV_PATH, index=False)
-        return df
-    try:
-        df = pd.read_csv(CSV_PATH)
-        # Ensure 'date' is datetime and 'amount' is numeric, handle potential errors
-        df['date'] = pd.to_datetime(df['date'], errors='coerce')
-        df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
-        df.dropna(subset=['date', 'amount'], inplace=True) # Drop rows where conversion failed
-        df['amount'] = df['amount'].replace([np.nan, np.inf, -np.inf], 0)
-        df['amount'] = df['amount'].fillna(0)
-        # Also sanitize description and category columns if needed
-        df['description'] = df['description'].replace([np.nan], "")
-        df['category'] = df['category'].replace([np.nan], "Uncategorized")
-        return df
-    except pd.errors.EmptyDataError:
-        df = pd.DataFrame(columns=['id', 'date', 'category', 'amount', 'description'])
-        return df
-    except Exception as e:
-        print(f"Error loading CSV: {e}")
-        # Return an empty DataFrame in case of other errors to prevent app crash
-        return pd.DataFrame(columns=['id', 'date', 'category', 'amount', 'description'])
-
-# Helper function to save expenses
+    return get_state().store.load()
+
+# Helper function to save expenses (full rewrite, atomic)
 def save_expenses(df):
-    # Convert date back to string for CSV storage if it's in datetime format
-    if 'date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['date']):
-        df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-    df.to_csv(CSV_PATH, index=False)
+    get_state().replace(df)
+
+# Helper function to add new expenses without rewriting the existing ones
+def append_expenses(new_expenses_df):
+    get_state().append(new_expenses_df)
+
+# Helper function to read the optional filters shared by the read routes:
+# ?start_date=&end_date=&category=a,b&min_amount=&max_amount= (raises ValueError).
+# Expenses are dated, not timed: any time of day or UTC offset is dropped, keeping the
+# calendar date as written, so every backend compares the same naive dates
+def parse_expense_filters(args):
+    import pandas as pd
+    filters = {}
+    for key in ('start_date', 'end_date'):
+        if args.get(key):
+            value = pd.to_datetime(args[key], format='ISO8601')
+            if pd.isna(value):
+                raise ValueError(f'{key} must be a date, got {args[key]!r}')
+            if value.tzinfo is not None:
+                value = value.tz_localize(None)
+            filters[key] = value.normalize()
+    categories = [c.strip() for value in args.getlist('category') for c in value.split(',') if c.strip()]
+    if categories:
+        filters['categories'] = categories
+    for key in ('min_amount', 'max_amount'):
+        if args.get(key):
+            filters[key] = float(args[key])
+    return filters
+
+# Decorator for read routes: the ETag is derived from the store's data version and the
+# request, so a client revalidating unchanged data gets an empty 304 without the view running
+def conditional_on_data_version(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = repr((g.get('user_id'), get_state().store.version(), request.full_path,
+                    request.accept_mimetypes.to_header()))
+        etag = hashlib.sha1(key.encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache' # Always revalidate
+        response.vary.add('Authorization')
+        return response
+    return wrapper
 
 # Helper function to check allowed file extensions
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Helper function to find actual column name from a list of possibilities
-def find_column_name(df_columns, potential_names):
-    df_columns_lower = [col.lower() for col in df_columns]
-    for name in potential_names:
-        if name.lower() in df_columns_lower:
-            return df_columns[df_columns_lower.index(name.lower())] # Return original casing
-    return None
 # --- API Routes ---
 
-@app.route('/api/expenses', methods=['GET', 'POST'])
+@api.route('/api/expenses', methods=['GET', 'POST'])
 def handle_expenses():
     if request.method == 'GET':
-        expenses_df = load_expenses()
-        return jsonify(expenses_df.to_dict(orient='records'))
-    
+        return list_expenses()
+
     elif request.method == 'POST':
         try:
+            import pandas as pd
             data = request.json
             if not all(k in data for k in ('date', 'category', 'amount')):
                 return jsonify({'error': 'Missing required fields: date, category, amount'}), 400
@@ -95,18 +220,72 @@ def handle_expenses():
                 'description': data.get('description', '')
             }
             
-            expenses_df = load_expenses()
-            new_expense_df = pd.DataFrame([new_expense])
-            expenses_df = pd.concat([expenses_df, new_expense_df], ignore_index=True)
-            save_expenses(expenses_df)
+            append_expenses(pd.DataFrame([new_expense]))
             return jsonify({'message': 'Expense added successfully', 'expense': new_expense}), 201
         except ValueError:
             return jsonify({'error': 'Invalid amount or date format'}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+# GET /api/expenses
+#   Filters: start_date, end_date, category (comma separated), min_amount, max_amount
+#   Order:   sort=date|-date|amount|-amount (ties broken by id)
+#   Paging:  limit (max MAX_PAGE_SIZE) and cursor (the previous page's next_cursor);
+#            paged responses are {"expenses": [...], "next_cursor": ...}
+#   Without limit/cursor every matching expense is streamed as a plain JSON array.
+#   ?format=ndjson (or Accept: application/x-ndjson) streams one expense per line instead,
+#   with the next cursor in the X-Next-Cursor header.
+@conditional_on_data_version
+def list_expenses():
+    from serializers import decode_cursor, encode_cursor, iter_json_array, iter_ndjson
+    from storage import SORT_COLUMNS
+    try:
+        filters = parse_expense_filters(request.args)
+        sort = request.args.get('sort', 'date')
+        descending = sort.startswith('-')
+        sort = sort.lstrip('-')
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f'Cannot sort by {sort}')
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        if limit is not None and limit < 1:
+            raise ValueError('limit must be positive')
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, sort) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameters: {e}'}), 400
+
+    paginated = limit is not None or cursor is not None
+    next_cursor = None
+    if paginated:
+        limit = min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        # One extra row tells whether there is a next page
+        with phase('store'):
+            expenses_df = get_state().store.page(sort, descending, after, limit + 1, **filters)
+        if len(expenses_df) > limit:
+            expenses_df = expenses_df.iloc[:limit]
+            next_cursor = encode_cursor(expenses_df.iloc[-1], sort)
+    else:
+        with phase('store'):
+            expenses_df = get_state().store.page(sort, descending, **filters)
+
+    wants_ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+    if wants_ndjson:
+        response = Response(timed_chunks('serialize', iter_ndjson(expenses_df)), mimetype='application/x-ndjson')
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    if paginated:
+        chunks = iter_json_array(expenses_df, 'expenses', {'next_cursor': next_cursor})
+    else:
+        chunks = iter_json_array(expenses_df)
+    return Response(timed_chunks('serialize', chunks), mimetype='application/json')
+
 # --- CSV Upload Feature ---
-@app.route('/api/expenses/upload_csv', methods=['POST'])
+# The upload is spooled to disk and imported in the background; the response carries
+# the import job's id, and GET /api/import_jobs/<job_id> reports its progress and result.
+# Rows already stored (same date, amount and description) are skipped as duplicates.
+@api.route('/api/expenses/upload_csv', methods=['POST'])
 def upload_csv():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part in the request'}), 400
@@ -115,166 +294,188 @@ def upload_csv():
         return jsonify({'error': 'No selected file'}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Save to a temporary location within the UPLOAD_FOLDER
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
+        from importer import CsvImportError, check_csv_header, import_expenses_csv
+        state = get_state()
+
+        metrics = current_app.extensions['metrics']
+
+        def run_import(stream, on_progress):
+            seen = {}  # Duplicate tracking for this upload, across its batches
+            with metrics.track('import_job', 'JOB'):
+                return import_expenses_csv(stream, lambda batch: state.append_new(batch, seen),
+                                           on_progress=on_progress)
+
         try:
-            file.save(filepath) # Save the file first
-            
-            # Now process the saved file
-            imported_count = 0
-            failed_rows_details = []
-            new_expenses_list = []
-
-            try:
-                upload_df = pd.read_csv(filepath)
-                
-                # Define potential column names for flexibility
-                column_map_potentials = {
-                    'date_col': ['date', 'transaction date', 'posting date'],
-                    'desc_col': ['description', 'narrative', 'details', 'transaction details', 'memo'],
-                    'amount_col': ['amount', 'debit', 'value', 'expense'] # Assumes positive values for expenses
-                }
-
-                actual_cols = {}
-                for key, potentials in column_map_potentials.items():
-                    found_col = find_column_name(upload_df.columns, potentials)
-                    if not found_col and key in ['date_col', 'amount_col']: # Date and Amount are essential
-                         return jsonify({'error': f'Missing required column. Could not find a column for: {key.replace("_col","")}. Expected one of {potentials}'}), 400
-                    actual_cols[key] = found_col
-                
-                for index, row in upload_df.iterrows():
-                    try:
-                        date_val = pd.to_datetime(row[actual_cols['date_col']]).strftime('%Y-%m-%d')
-                        # Description is optional in the CSV, default to empty string if column not found or empty
-                        description_val = str(row[actual_cols['desc_col']]) if actual_cols['desc_col'] and actual_cols['desc_col'] in row and pd.notna(row[actual_cols['desc_col']]) else "Uploaded via CSV"
-                        amount_val = float(row[actual_cols['amount_col']])
-
-                        if amount_val <= 0: # Expenses should be positive amounts
-                            failed_rows_details.append({'row_number': index + 2, 'data': row.to_dict(), 'reason': 'Amount must be a positive value for an expense.'})
-                            continue
-
-                        new_expense = {
-                            'id': str(uuid.uuid4()),
-                            'date': date_val,
-                            'category': 'Uncategorized', # Default category for uploaded expenses
-                            'amount': amount_val,
-                            'description': description_val
-                        }
-                        new_expenses_list.append(new_expense)
-                        imported_count += 1
-                    except Exception as e:
-                        failed_rows_details.append({'row_number': index + 2, 'data': row.to_dict(), 'reason': f'Error parsing row: {str(e)}'})
-
-                if new_expenses_list:
-                    expenses_df = load_expenses()
-                    new_expenses_to_add_df = pd.DataFrame(new_expenses_list)
-                    expenses_df = pd.concat([expenses_df, new_expenses_to_add_df], ignore_index=True)
-                    save_expenses(expenses_df)
-                
-                response_message = f'{imported_count} expenses imported successfully.'
-                if failed_rows_details:
-                    response_message += f' {len(failed_rows_details)} rows failed to import.'
-                
-                return jsonify({
-                    'message': response_message,
-                    'imported_count': imported_count,
-                    'failed_rows_details': failed_rows_details if failed_rows_details else "None"
-                }), 200
-
-            except pd.errors.EmptyDataError:
-                return jsonify({'error': 'Uploaded CSV file is empty.'}), 400
-            except Exception as e: # Catch-all for processing errors
-                app.logger.error(f"Error processing CSV content: {e}")
-                return jsonify({'error': f'Error processing CSV content: {str(e)}'}), 500
-        finally: # Ensure cleanup of the temporary file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            # An empty file or missing required column is still rejected right away
+            job = get_import_jobs().submit(file, run_import, check=check_csv_header, owner=g.get('user_id'))
+        except CsvImportError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e: # Catch-all for processing errors
+            current_app.logger.error(f"Error processing CSV content: {e}")
+            return jsonify({'error': f'Error processing CSV content: {str(e)}'}), 500
+
+        status_url = f"/api/import_jobs/{job['id']}"
+        response = jsonify({
+            'message': 'CSV import started.',
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': status_url
+        })
+        response.status_code = 202
+        response.headers['Location'] = status_url
+        return response
     else:
         return jsonify({'error': 'File type not allowed. Please upload a CSV file.'}), 400
 
+# GET /api/import_jobs/<job_id>
+#   status is queued, running, completed or failed; progress has the bytes read and the
+#   rows imported / skipped as duplicates / failed so far. Once completed, result holds
+#   the import's full report (including up to 100 failed rows with their reasons).
+@api.route('/api/import_jobs/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    job = get_import_jobs().get(job_id, owner=g.get('user_id'))
+    if job is None:
+        return jsonify({'error': 'Import job not found'}), 404
+    if job['status'] == 'completed':
+        result = job['result']
+        message = f"{result['imported_count']} expenses imported successfully."
+        if result['duplicate_count']:
+            message += f" {result['duplicate_count']} duplicate rows skipped."
+        if result['failed_count']:
+            message += f" {result['failed_count']} rows failed to import."
+        job['message'] = message
+    elif job['status'] == 'failed':
+        job['message'] = f"Import failed: {job['error']}"
+    else:
+        job['message'] = f"Import {job['status']}."
+    return jsonify(job)
+
 # --- Spending Insights Dashboard Features ---
 
-@app.route('/api/insights/summary', methods=['GET'])
+@api.route('/api/insights/summary', methods=['GET'])
+@conditional_on_data_version
 def get_insights_summary():
-    expenses_df = load_expenses()
-    if expenses_df.empty:
+    try:
+        filters = parse_expense_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter parameters'}), 400
+    # Unfiltered totals come from the running aggregates, filtered ones from the store
+    state = get_state()
+    if filters:
+        with phase('store'):
+            summary = state.store.summary(**filters)
+    else:
+        with phase('aggregate'):
+            summary = state.aggregates.snapshot(state.store)
+    if summary['count'] == 0:
         return jsonify({'total_spending': 0, 'average_transaction': 0, 'count': 0})
 
-    total_spending = expenses_df['amount'].sum()
-    average_transaction = expenses_df['amount'].mean() if not expenses_df.empty else 0
-    count = len(expenses_df)
-    
     return jsonify({
-        'total_spending': round(float(total_spending), 2),
-        'average_transaction': round(float(average_transaction), 2),
-        'count': count
+        'total_spending': round(summary['total'], 2),
+        'average_transaction': round(summary['total'] / summary['count'], 2),
+        'count': summary['count']
     })
 
-@app.route('/api/insights/spending_by_category', methods=['GET'])
+@api.route('/api/insights/spending_by_category', methods=['GET'])
+@conditional_on_data_version
 def get_spending_by_category():
-    expenses_df = load_expenses()
-    if expenses_df.empty:
-        return jsonify({})
-        
-    spending_by_category = expenses_df.groupby('category')['amount'].sum().round(2)
-    return jsonify(spending_by_category.apply(float).to_dict())
-
-@app.route('/api/insights/monthly_spending', methods=['GET'])
-def get_monthly_spending():
-    expenses_df = load_expenses()
-    if expenses_df.empty:
-        return jsonify({})
+    try:
+        filters = parse_expense_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter parameters'}), 400
+    state = get_state()
+    if filters:
+        with phase('store'):
+            spending_by_category = state.store.totals_by_category(**filters)
+    else:
+        with phase('aggregate'):
+            spending_by_category = state.aggregates.snapshot(state.store)['by_category']
+    return jsonify({category: round(total, 2) for category, total in spending_by_category.items()})
 
-    # Ensure 'date' is datetime for resampling
-    expenses_df['date'] = pd.to_datetime(expenses_df['date'])
-    expenses_df['month_year'] = expenses_df['date'].dt.to_period('M').astype(str)
-    monthly_spending = expenses_df.groupby('month_year')['amount'].sum().round(2)
-    monthly_spending = monthly_spending.sort_index() # Ensure chronological order
-    return jsonify(monthly_spending.apply(float).to_dict())
+@api.route('/api/insights/monthly_spending', methods=['GET'])
+@conditional_on_data_version
+def get_monthly_spending():
+    try:
+        filters = parse_expense_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid filter parameters'}), 400
+    state = get_state()
+    if filters:
+        with phase('store'):
+            monthly_spending = state.store.totals_by_month(**filters)
+    else:
+        with phase('aggregate'):
+            monthly_spending = state.aggregates.snapshot(state.store)['by_month']
+    # Both are already in chronological order
+    return jsonify({month: round(total, 2) for month, total in monthly_spending.items()})
 
 # --- Expense Prediction Feature ---
 
-@app.route('/api/predict/next_month_total', methods=['GET'])
+@api.route('/api/predict/next_month_total', methods=['GET'])
+@conditional_on_data_version
 def predict_next_month_total():
-    expenses_df = load_expenses()
-    if expenses_df.empty: # Check if DataFrame is empty after loading
-        return jsonify({'prediction': 0, 'message': 'No expense data available for prediction.'})
-    
-    monthly_totals = expenses_df.set_index('date').resample('M')['amount'].sum()
-    
-    num_months = len(monthly_totals)
-    prediction_val = 0
-    message = ""
+    state = get_state()
+    with phase('forecast'):
+        forecast = state.forecasts.forecast(state.store, horizon=1)
+    num_months = forecast['history_months']
     if num_months == 0:
-        return jsonify({'prediction': 0, 'message': 'Not enough monthly data to form a prediction basis.'})
-    elif num_months < 3: # Need at least 3 data points for a somewhat reliable linear regression
-        prediction_val = monthly_totals.mean()
+        return jsonify({'prediction': 0, 'message': 'No expense data available for prediction.'})
+
+    prediction_val = forecast['total'][0]
+    if forecast['method'] == 'average':
         message = f"Prediction based on average of {num_months} available month(s). More data is needed for a machine learning model."
-    else: # 3 or more months of data, use Linear Regression
-        try:
-            X = np.arange(num_months).reshape(-1, 1)
-            y = monthly_totals.values
+    else:
+        message = "Prediction based on a linear regression model of historical monthly spending."
+    return jsonify({'prediction': round(float(prediction_val), 2), 'message': message})
 
-            model = LinearRegression()
-            model.fit(X, y)
+# GET /api/predict/forecast?months=N
+# Forecasts for the next N months (default 3), for the total and for every category
+@api.route('/api/predict/forecast', methods=['GET'])
+@conditional_on_data_version
+def predict_forecast():
+    from forecasting import MAX_FORECAST_MONTHS
+    try:
+        horizon = int(request.args.get('months', 3))
+        if not 1 <= horizon <= MAX_FORECAST_MONTHS:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'months must be a whole number between 1 and {MAX_FORECAST_MONTHS}'}), 400
 
-            # Predict for the next month (index num_months)
-            predicted_total = model.predict(np.array([[num_months]]))[0]
-            prediction_val = max(0, predicted_total) # Expenses should not be negative
-            message = "Prediction based on a linear regression model of historical monthly spending."
-        except Exception as e:
-            app.logger.error(f"Error during ML prediction: {e}")
-            # Fallback to a simple average if ML model fails
-            prediction_val = monthly_totals.mean()
-            message = "ML model prediction failed. Prediction based on historical average spending."
-    return jsonify({'prediction': round(float(prediction_val), 2), 'message': message})
+    state = get_state()
+    with phase('forecast'):
+        forecast = state.forecasts.forecast(state.store, horizon=horizon)
+    return jsonify({
+        'months': forecast['months'],
+        'method': forecast['method'],
+        'history_months': forecast['history_months'],
+        'total': [round(v, 2) for v in forecast['total']],
+        'by_category': {category: [round(v, 2) for v in values]
+                        for category, values in forecast['by_category'].items()}
+    })
+
+# --- Storage Diagnostics ---
+
+@api.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    stats = get_state().stats()
+    if current_app.config['USER_PARTITIONS']:
+        stats['partitions'] = get_user_states().stats()
+    return jsonify(stats)
+
+# GET /api/metrics
+# Prometheus text format: request counts, latency histograms per route and method, and
+# histograms of the time spent per phase (store, aggregate, forecast, serialize, ...).
+# Background imports are reported under the route 'import_job'.
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(current_app.extensions['metrics'].render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Liveness check for load balancers and process managers; doesn't touch the data
+@api.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok'})
 
 
 if __name__ == '__main__':
-    # Create expenses.csv if it doesn't exist
-    if not os.path.exists(CSV_PATH):
-        df = pd.DataFrame(columns=['id', 'date', 'category', 'amount', 'description'])
-        df.to_csv(CSV_PATH, index=False)
-    app.run(debug=True, port=5001) # Run on a different port than Next.js, e.g., 5001
\ No newline at end of file
+    create_app().run(debug=True, port=5001) # Run on a different port than Next.js, e.g., 5001
\ No newline at end of file
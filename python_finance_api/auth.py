@@ -0,0 +1,59 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+# Lifetime of the tokens sign_user_token() issues by default
+TOKEN_TTL_SECONDS = 3600
+
+
+class AuthError(ValueError):
+    """The request doesn't carry a valid user token."""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(payload, secret):
+    return _b64encode(hmac.new(secret.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+# Tokens are '<payload>.<signature>': the base64url JSON {"sub": user id, "exp": unix time}
+# and its base64url HMAC-SHA256 under the secret shared with the front end, which issues
+# them to signed-in users (pft-app: /api/finance-token)
+def sign_user_token(user_id, secret, ttl=TOKEN_TTL_SECONDS):
+    payload = _b64encode(json.dumps({'sub': str(user_id), 'exp': int(time.time()) + ttl},
+                                    separators=(',', ':')).encode())
+    return f'{payload}.{_signature(payload, secret)}'
+
+
+# Returns the user id the token was issued for; raises AuthError if it is malformed,
+# forged or expired
+def verify_user_token(token, secret):
+    payload, _, signature = token.partition('.')
+    # Compared as bytes: compare_digest() rejects str with non-ASCII characters
+    expected = _signature(payload, secret).encode()
+    if not payload or not hmac.compare_digest(signature.encode(), expected):
+        raise AuthError('Invalid token')
+    try:
+        claims = json.loads(_b64decode(payload))
+        user_id, expires = str(claims['sub']), float(claims['exp'])
+    except (TypeError, KeyError, ValueError) as e:
+        raise AuthError('Invalid token') from e
+    if expires < time.time():
+        raise AuthError('Token expired')
+    return user_id
+
+
+# Reads the user from an 'Authorization: Bearer <token>' header value
+def user_from_authorization(header, secret):
+    scheme, _, token = (header or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        raise AuthError('Missing bearer token')
+    return verify_user_token(token.strip(), secret)
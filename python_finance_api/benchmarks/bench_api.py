@@ -0,0 +1,255 @@
+# End-to-end latency of every API route, and of the CSV upload, through the Flask test client.
+#   python benchmarks/bench_api.py [--rows 1000 100000 1000000] [--backend csv sqlite parquet]
+#                                  [--repeat 20] [--users 100] [--json report.json] [--compare baseline.json]
+# For every data size and backend, synthetic data is generated into a temporary directory and
+# each case is timed cold (first request after startup) and warm (--repeat more requests).
+# With --users N the data is split evenly over N per-user partitions (USER_PARTITIONS) and
+# every request is made as one of those users, so only their share of --rows is touched.
+# The report also carries the per-phase timings from /api/metrics and the environment, so
+# reports from different versions can be compared with --compare.
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import flask  # noqa: E402
+from app import create_app  # noqa: E402
+from auth import sign_user_token  # noqa: E402
+from storage import DEFAULT_PATHS, UserPartitions  # noqa: E402
+from synthetic import write_store, write_upload_csv  # noqa: E402
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+# A warm case stops repeating after this long (once it has run at least 3 times)
+MAX_SECONDS_PER_CASE = 10.0
+
+# name -> GET path; every read route, with and without filters
+READ_CASES = {
+    'health': '/api/health',
+    'expenses_all': '/api/expenses',
+    'expenses_page': '/api/expenses?limit=100',
+    'expenses_page_by_amount': '/api/expenses?limit=100&sort=-amount',
+    'expenses_page_ndjson': '/api/expenses?limit=1000&format=ndjson',
+    'expenses_filtered': '/api/expenses?category=Dining,Transport&start_date=2025-01-01&min_amount=10&limit=1000',
+    'insights_summary': '/api/insights/summary',
+    'insights_summary_filtered': '/api/insights/summary?category=Groceries&start_date=2025-01-01',
+    'spending_by_category': '/api/insights/spending_by_category',
+    'spending_by_category_filtered': '/api/insights/spending_by_category?start_date=2025-06-01',
+    'monthly_spending': '/api/insights/monthly_spending',
+    'monthly_spending_filtered': '/api/insights/monthly_spending?category=Rent',
+    'predict_next_month_total': '/api/predict/next_month_total',
+    'predict_forecast': '/api/predict/forecast?months=6',
+    'cache_stats': '/api/cache/stats',
+    'metrics': '/api/metrics',
+}
+
+
+def summarize(timings):
+    timings = np.array(timings) * 1e3
+    return {'runs': len(timings), 'min_ms': float(timings.min()), 'median_ms': float(np.median(timings)),
+            'p95_ms': float(np.percentile(timings, 95)), 'mean_ms': float(timings.mean())}
+
+
+# Sends one request and reads the whole body (streamed responses included), then closes
+# the response so the app records it
+def timed_request(client, method, path, **kwargs):
+    start = time.perf_counter()
+    response = client.open(path, method=method, **kwargs)
+    body = response.get_data()
+    response.close()
+    return time.perf_counter() - start, response.status_code, len(body), response
+
+
+def run_case(client, name, method, path, repeat, make_kwargs=dict):
+    cold, status, size, response = timed_request(client, method, path, **make_kwargs())
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat and (len(timings) < 3 or time.perf_counter() - started < MAX_SECONDS_PER_CASE):
+        timings.append(timed_request(client, method, path, **make_kwargs())[0])
+    return {'case': name, 'method': method, 'path': path, 'status': status, 'bytes': size,
+            'cold_ms': cold * 1e3, **summarize(timings)}, response
+
+
+# Uploads a statement and waits for its import job. Returns (request seconds, seconds until
+# the job finished, final job status)
+def run_upload(client, data):
+    start = time.perf_counter()
+    response = client.post('/api/expenses/upload_csv', content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(data), 'statement.csv')})
+    accepted = time.perf_counter() - start
+    status_url = response.headers['Location']
+    response.close()
+    while True:
+        job = client.get(status_url).get_json()
+        if job['status'] in ('completed', 'failed'):
+            return accepted, time.perf_counter() - start, job
+        time.sleep(0.01)
+
+
+def bench(rows, backend, repeat, upload_rows, workdir, users=0):
+    data_path = os.path.join(workdir, DEFAULT_PATHS[backend])
+    config = {'STORAGE_BACKEND': backend, 'STORAGE_PATH': data_path, 'PRELOAD_DATA': False,
+              'IMPORT_JOBS_DIR': os.path.join(workdir, 'import_jobs'), 'METRICS_DIR': None}
+    if users:
+        config.update(USER_PARTITIONS=True, AUTH_SECRET='benchmark', PARTITIONS_DIR=os.path.join(workdir, 'users'),
+                      PARTITION_SHARDED=True)
+        partitions = UserPartitions(config['PARTITIONS_DIR'], backend, sharded=True)
+        for user in range(users):
+            path = partitions.path(user)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_store(backend, path, rows // users + (user < rows % users), seed=user)
+    else:
+        write_store(backend, data_path, rows)
+    upload_path = os.path.join(workdir, 'statement.csv')
+    write_upload_csv(upload_path, upload_rows, seed=1)
+    with open(upload_path, 'rb') as f:
+        upload = f.read()
+
+    start = time.perf_counter()
+    app = create_app(config)
+    create_seconds = time.perf_counter() - start
+    client = app.test_client()
+    if users:
+        client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {sign_user_token(0, config["AUTH_SECRET"])}'
+    results = []
+
+    for name, path in READ_CASES.items():
+        row, response = run_case(client, name, 'GET', path, repeat)
+        results.append(row)
+        if name == 'insights_summary':
+            # Revalidation with the ETag of an unchanged resource
+            etag = response.headers['ETag']
+            row, _ = run_case(client, 'insights_summary_304', 'GET', path, repeat,
+                              lambda: {'headers': {'If-None-Match': etag}})
+            results.append(row)
+        if name == 'expenses_page':
+            cursor = json.loads(response.get_data())['next_cursor']
+            row, _ = run_case(client, 'expenses_next_page', 'GET', f'{path}&cursor={cursor}', repeat)
+            results.append(row)
+
+    # Writes last: each one changes the data version the read caches are keyed on
+    row, _ = run_case(client, 'add_expense', 'POST', '/api/expenses', repeat, lambda: {'json': {
+        'date': '2025-12-01', 'category': 'Dining', 'amount': 12.5, 'description': 'Benchmark lunch'}})
+    results.append(row)
+    row, _ = run_case(client, 'insights_summary_after_write', 'GET', '/api/insights/summary', 1)
+    results.append(row)
+    for name in ('upload_csv', 'upload_csv_duplicate'):
+        accepted, finished, job = run_upload(client, upload)
+        results.append({'case': name, 'method': 'POST', 'path': '/api/expenses/upload_csv',
+                        'status': job['status'], 'bytes': len(upload), 'upload_rows': upload_rows,
+                        'accepted_ms': accepted * 1e3, 'completed_ms': finished * 1e3,
+                        'rows_per_second': upload_rows / finished,
+                        'imported_count': job['progress']['imported_count'],
+                        'duplicate_count': job['progress']['duplicate_count']})
+
+    for row in results:
+        row.update(rows=rows, backend=backend, users=users)
+    return {'rows': rows, 'backend': backend, 'users': users, 'create_app_ms': create_seconds * 1e3,
+            'results': results, 'phases': phase_means(app)}
+
+
+# Mean time per phase and route, from the app's request metrics
+def phase_means(app):
+    snapshot = app.extensions['metrics'].snapshot()
+    means = {}
+    for route, name, histogram in snapshot['phases']:
+        means.setdefault(route, {})[name] = {'count': histogram['count'],
+                                             'mean_ms': histogram['sum'] / histogram['count'] * 1e3}
+    return means
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=API_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'git_commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpu_count': os.cpu_count(), 'pandas': pd.__version__,
+            'numpy': np.__version__, 'flask': flask.__version__}
+
+
+# Prints the change in median (or completion) time per case against an earlier report.
+# Returns the cases that got slower by more than `threshold` (e.g. 1.25 = 25% slower).
+def compare(report, baseline, threshold):
+    def key(row):
+        return row['backend'], row['rows'], row['case'], row.get('upload_rows'), row.get('users', 0)
+
+    def value(row):
+        return row.get('median_ms', row.get('completed_ms'))
+
+    previous = {key(row): row for run in baseline['runs'] for row in run['results']}
+    regressions = []
+    for run in report['runs']:
+        for row in run['results']:
+            old = previous.get(key(row))
+            if old is None or not value(old):
+                continue
+            ratio = value(row) / value(old)
+            flag = ''
+            if ratio > threshold:
+                flag = '  REGRESSION'
+                regressions.append({'backend': key(row)[0], 'rows': key(row)[1], 'case': row['case'], 'ratio': ratio})
+            print(f'{key(row)[0]:8s} {key(row)[1]:>9d} {row["case"]:32s} {value(old):10.2f} -> '
+                  f'{value(row):10.2f} ms  x{ratio:5.2f}{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every API route through the Flask test client.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Data sizes to benchmark (synthetic expenses, 1k to 10M)')
+    parser.add_argument('--backend', nargs='+', default=['csv'], choices=list(DEFAULT_PATHS))
+    parser.add_argument('--repeat', type=int, default=20, help='Warm requests per case')
+    parser.add_argument('--upload-rows', type=int, default=50000, help='Rows in the uploaded statement')
+    parser.add_argument('--users', type=int, default=0,
+                        help='Split --rows over this many per-user partitions (0: one shared store)')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--compare', help='Earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown ratio reported as a regression by --compare')
+    args = parser.parse_args(argv)
+
+    report = {'benchmark': 'api', 'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+              'environment': environment(), 'settings': vars(args), 'runs': []}
+    for backend in args.backend:
+        for rows in args.rows:
+            with tempfile.TemporaryDirectory(prefix='bench-api-') as workdir:
+                run = bench(rows, backend, args.repeat, args.upload_rows, workdir, args.users)
+            report['runs'].append(run)
+            per_user = f', {args.users} users' if args.users else ''
+            print(f'\n{backend} - {rows} rows{per_user} (create_app {run["create_app_ms"]:.1f} ms)')
+            for row in run['results']:
+                if 'median_ms' in row:
+                    print(f'  {row["case"]:32s} {row["status"]:>4} cold={row["cold_ms"]:10.2f} ms  '
+                          f'median={row["median_ms"]:10.2f} ms  p95={row["p95_ms"]:10.2f} ms  ({row["runs"]} runs)')
+                else:
+                    print(f'  {row["case"]:32s} {row["status"]:>9} accepted={row["accepted_ms"]:8.2f} ms  '
+                          f'completed={row["completed_ms"]:10.2f} ms  ({row["rows_per_second"]:,.0f} rows/s)')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f'\nCompared with {args.compare} ({baseline["environment"].get("git_commit")}):')
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} case(s) slower than x{args.threshold}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
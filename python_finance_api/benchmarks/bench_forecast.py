@@ -0,0 +1,81 @@
+# Fit latency of the batched forecaster versus history length and number of categories.
+#   python benchmarks/bench_forecast.py [--repeat 20] [--json results.json]
+# With scikit-learn installed, also times the old approach (one LinearRegression per series).
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from forecasting import ForecastEngine, forecast_series, month_range  # noqa: E402
+
+try:
+    from sklearn.linear_model import LinearRegression
+except ImportError:
+    LinearRegression = None
+
+MONTHS = (12, 36, 120, 360)
+CATEGORIES = (5, 20, 100, 1000)
+HORIZON = 3
+
+
+def synthetic_totals(num_months, num_categories, seed=0):
+    rng = np.random.default_rng(seed)
+    months = month_range('2000-01', np.datetime64('2000-01', 'M') + num_months - 1)
+    return {(f'category-{c}', m): float(v)
+            for c in range(num_categories)
+            for m, v in zip(months, rng.gamma(2.0, 50.0, num_months))}
+
+
+def median_seconds(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def sklearn_fit(series):
+    X = np.arange(series.shape[1]).reshape(-1, 1)
+    for row in series:
+        LinearRegression().fit(X, row).predict(np.arange(X.shape[0], X.shape[0] + HORIZON).reshape(-1, 1))
+
+
+def run(repeat):
+    results = []
+    for num_months in MONTHS:
+        for num_categories in CATEGORIES:
+            totals = synthetic_totals(num_months, num_categories)
+            # End to end: dense matrix from the aggregate totals plus the batched fit
+            end_to_end = median_seconds(lambda: ForecastEngine._fit(totals, HORIZON), repeat)
+            series = np.random.default_rng(1).gamma(2.0, 50.0, (num_categories + 1, num_months))
+            fit_only = median_seconds(lambda: forecast_series(series, HORIZON), repeat)
+            row = {'months': num_months, 'categories': num_categories,
+                   'fit_ms': fit_only * 1e3, 'end_to_end_ms': end_to_end * 1e3}
+            if LinearRegression is not None and num_categories <= 100:
+                row['sklearn_loop_ms'] = median_seconds(lambda: sklearn_fit(series), max(1, repeat // 5)) * 1e3
+            results.append(row)
+            print(f"months={num_months:4d} categories={num_categories:5d} "
+                  f"fit={row['fit_ms']:8.3f} ms  end_to_end={row['end_to_end_ms']:8.3f} ms"
+                  + (f"  sklearn_loop={row['sklearn_loop_ms']:9.3f} ms" if 'sklearn_loop_ms' in row else ''))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args(argv)
+    results = run(args.repeat)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'forecast', 'horizon': HORIZON, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# Cold start and per-worker memory of the API.
+#   python benchmarks/bench_startup.py [--rows 200000] [--workers 4] [--json results.json]
+# In fresh interpreters: time to import the app and create it (lazily and with
+# PRELOAD_DATA), and the first /api/health and /api/insights/summary requests.
+# With gunicorn installed, it also starts gunicorn -c gunicorn.conf.py in each serving
+# mode and reads every worker's RSS, PSS (shared pages split between the processes
+# sharing them) and USS (pages private to the worker) from /proc/<pid>/smaps_rollup.
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_store  # noqa: E402
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Runs in a fresh interpreter and prints its timings as JSON
+PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+pandas_loaded = 'pandas' in sys.modules
+client = app.test_client()
+client.get('/api/health')
+health = time.perf_counter()
+client.get('/api/insights/summary')
+summary = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'create_app_s': created - imported,
+    'first_health_s': health - created,
+    'first_summary_s': summary - health,
+    'pandas_loaded_at_create': pandas_loaded,
+}))
+'''
+
+# name -> (GUNICORN_PRELOAD, EXPENSE_PRELOAD)
+GUNICORN_MODES = {
+    'preload': ('1', '1'),  # Data loaded once in the master, shared copy-on-write
+    'per_worker_load': ('0', '1'),  # Every worker imports the app and loads the data at boot
+    'lazy': ('0', '0'),  # Every worker loads on its first data request
+}
+
+
+def probe(env, preload):
+    env = {**env, 'EXPENSE_PRELOAD': '1' if preload else '0'}
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=API_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(url, timeout=60):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def memory_kb(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss_kb': fields.get('Rss', 0), 'pss_kb': fields.get('Pss', 0),
+            'uss_kb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def run_gunicorn(env, mode, workers, requests_per_worker=20):
+    gunicorn_preload, expense_preload = GUNICORN_MODES[mode]
+    port = free_port()
+    env = {**env, 'GUNICORN_PRELOAD': gunicorn_preload, 'EXPENSE_PRELOAD': expense_preload,
+           'GUNICORN_BIND': f'127.0.0.1:{port}', 'WEB_CONCURRENCY': str(workers), 'GUNICORN_THREADS': '1'}
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                get(f'http://127.0.0.1:{port}/api/health', timeout=1)
+                break
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+                time.sleep(0.02)
+        first_response = time.perf_counter() - start
+        while len(children(server.pid)) < workers:
+            time.sleep(0.02)
+        boot_memory = [memory_kb(pid) for pid in children(server.pid)]
+        # Spread data requests over the workers so each one has built its state
+        for _ in range(workers * requests_per_worker):
+            get(f'http://127.0.0.1:{port}/api/insights/summary')
+        ready = time.perf_counter() - start
+        worker_memory = [memory_kb(pid) for pid in children(server.pid)]
+        master_memory = memory_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    def mean(rows, key):
+        return float(np.mean([row[key] for row in rows]))
+
+    return {
+        'mode': mode, 'workers': workers,
+        'first_response_s': first_response, 'serving_data_s': ready,
+        'master_rss_kb': master_memory['rss_kb'],
+        'boot_worker_rss_kb': mean(boot_memory, 'rss_kb'),
+        'worker_rss_kb': mean(worker_memory, 'rss_kb'),
+        'worker_pss_kb': mean(worker_memory, 'pss_kb'),
+        'worker_uss_kb': mean(worker_memory, 'uss_kb'),
+        'total_pss_kb': master_memory['pss_kb'] + sum(row['pss_kb'] for row in worker_memory),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000, help='Synthetic expenses in the data file')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters per startup probe')
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        data_file = os.path.join(data_dir, 'expenses.csv')
+        write_store('csv', data_file, args.rows)
+        env = {**os.environ, 'EXPENSE_STORAGE_BACKEND': 'csv', 'EXPENSE_STORAGE_PATH': data_file}
+
+        startup = {}
+        for name, preload in (('lazy', False), ('preload', True)):
+            runs = [probe(env, preload) for _ in range(args.repeat)]
+            startup[name] = {key: float(np.median([run[key] for run in runs])) for key in runs[0]
+                             if key != 'pandas_loaded_at_create'}
+            startup[name]['pandas_loaded_at_create'] = runs[0]['pandas_loaded_at_create']
+            print(f'{name:8s} ' + '  '.join(f'{k}={v * 1e3:8.1f} ms' for k, v in startup[name].items()
+                                            if k.endswith('_s')))
+
+        servers = []
+        if importlib.util.find_spec('gunicorn'):
+            for mode in GUNICORN_MODES:
+                row = run_gunicorn(env, mode, args.workers)
+                servers.append(row)
+                print(f"gunicorn {mode:16s} first_response={row['first_response_s']:6.2f} s  "
+                      f"serving_data={row['serving_data_s']:6.2f} s  "
+                      f"worker rss={row['worker_rss_kb'] / 1024:7.1f} MiB  "
+                      f"pss={row['worker_pss_kb'] / 1024:7.1f} MiB  uss={row['worker_uss_kb'] / 1024:7.1f} MiB  "
+                      f"total pss={row['total_pss_kb'] / 1024:7.1f} MiB")
+        else:
+            print('gunicorn is not installed; skipping the multi-worker measurements')
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'benchmark': 'startup', 'rows': args.rows, 'startup': startup, 'gunicorn': servers}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Synthetic expense data for the benchmarks, from a thousand rows to tens of millions.
+#   python benchmarks/synthetic.py --rows 1000000 --out expenses.csv
+#   python benchmarks/synthetic.py --rows 1000000 --backend sqlite --out expenses.sqlite3
+#   python benchmarks/synthetic.py --rows 50000 --format upload --out statement.csv
+# Rows are generated (and written) in chunks, so memory stays flat whatever --rows is.
+# The same seed always produces the same data.
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from storage import BACKENDS, iso_dates, open_store  # noqa: E402
+
+CHUNK_ROWS = 1_000_000
+END_DATE = np.datetime64('2025-12-31')  # Histories end here and reach back span_days()
+
+# category -> (share of transactions, median amount, spread of log amount, descriptions)
+CATEGORIES = {
+    'Groceries': (0.24, 45.0, 0.6, ['Supermarket', 'Weekly groceries', 'Farmers market', 'Corner shop']),
+    'Dining': (0.18, 22.0, 0.7, ['Coffee shop', 'Lunch', 'Dinner out', 'Takeaway', 'Bakery']),
+    'Transport': (0.15, 12.0, 0.8, ['Bus fare', 'Train ticket', 'Taxi ride', 'Fuel', 'Parking']),
+    'Shopping': (0.12, 60.0, 0.9, ['Clothes', 'Gadgets', 'Books', 'Home goods', 'Online order']),
+    'Utilities': (0.07, 85.0, 0.4, ['Electricity bill', 'Water bill', 'Internet', 'Phone plan']),
+    'Entertainment': (0.10, 30.0, 0.8, ['Cinema', 'Concert tickets', 'Streaming subscription', 'Games']),
+    'Health': (0.06, 40.0, 0.9, ['Pharmacy', 'Doctor visit', 'Gym membership', 'Dentist']),
+    'Education': (0.03, 120.0, 0.8, ['Online course', 'Textbooks', 'Workshop']),
+    'Rent': (0.05, 1200.0, 0.15, ['Monthly rent']),
+}
+
+
+# Number of days the data covers: about 3 transactions a day per simulated account,
+# between one year and fifteen
+def span_days(rows):
+    return int(np.clip(rows / 3, 365, 15 * 365))
+
+
+# Yields DataFrames of at most `chunk_rows` expenses in the stored schema
+# (id, date, category, amount, description), `rows` in total
+def generate_expenses(rows, seed=0, chunk_rows=CHUNK_ROWS):
+    rng = np.random.default_rng(seed)
+    names = list(CATEGORIES)
+    shares = np.array([CATEGORIES[name][0] for name in names])
+    shares /= shares.sum()
+    days = span_days(rows)
+    start_date = END_DATE - days + 1
+    for start in range(0, rows, chunk_rows):
+        count = min(chunk_rows, rows - start)
+        category_index = rng.choice(len(names), size=count, p=shares)
+        medians = np.array([CATEGORIES[name][1] for name in names])[category_index]
+        spreads = np.array([CATEGORIES[name][2] for name in names])[category_index]
+        amounts = np.round(medians * np.exp(rng.normal(0.0, spreads)), 2).clip(min=0.01)
+        # Later days are a little busier (the account's spending grows), and weekend
+        # purchases run a little larger
+        offsets = np.floor(days * np.sqrt(rng.random(count) * 0.3 + 0.7 * rng.random(count))).astype(np.int64)
+        dates = start_date + np.sort(offsets).astype('timedelta64[D]')
+        weekend = ((dates.astype('datetime64[D]').view('int64') - 4) % 7) >= 5
+        amounts = np.where(weekend, np.round(amounts * 1.2, 2), amounts)
+        descriptions = np.empty(count, dtype=object)
+        for i, name in enumerate(names):
+            mask = category_index == i
+            options = np.array(CATEGORIES[name][3], dtype=object)
+            descriptions[mask] = options[rng.integers(0, len(options), int(mask.sum()))]
+        yield pd.DataFrame({
+            'id': [f'syn-{seed}-{i:09d}' for i in range(start, start + count)],
+            'date': pd.to_datetime(dates),
+            'category': np.array(names, dtype=object)[category_index],
+            'amount': amounts,
+            'description': descriptions,
+        })
+
+
+# Writes a bank-statement style CSV (Date,Description,Amount) for the upload endpoint
+def write_upload_csv(path, rows, seed=0):
+    with open(path, 'w', newline='') as f:
+        for i, chunk in enumerate(generate_expenses(rows, seed)):
+            chunk = pd.DataFrame({'Date': iso_dates(chunk['date']),
+                                  'Description': chunk['description'], 'Amount': chunk['amount']})
+            chunk.to_csv(f, index=False, header=i == 0)
+
+
+# Fills a store of the given backend at `path` with `rows` expenses (replacing its contents)
+def write_store(backend, path, rows, seed=0):
+    if backend == 'csv':
+        # Written directly: much faster than appending through the store for millions of rows
+        with open(path, 'w', newline='') as f:
+            for i, chunk in enumerate(generate_expenses(rows, seed)):
+                chunk.assign(date=iso_dates(chunk['date'])).to_csv(f, index=False, header=i == 0)
+        return open_store('csv', path)
+    store = open_store(backend, path)
+    for i, chunk in enumerate(generate_expenses(rows, seed)):
+        if i == 0:
+            store.replace(chunk)
+        else:
+            store.append(chunk)
+    store.compact(force=True)
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic expense data.')
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--out', required=True, help='File (or directory, for parquet) to write')
+    parser.add_argument('--format', choices=('store', 'upload'), default='store',
+                        help="'store': expenses in a storage backend; 'upload': a CSV for upload_csv")
+    parser.add_argument('--backend', choices=BACKENDS, default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.format == 'upload':
+        write_upload_csv(args.out, args.rows, args.seed)
+    else:
+        write_store(args.backend, args.out, args.rows, args.seed)
+    print(f'Wrote {args.rows} synthetic expenses to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from metrics import phase
+from storage import iso_dates
+
+
+# Helper function to normalise descriptions for duplicate detection: case and runs of
+# whitespace differ between exports of the same statement
+def normalize_descriptions(descriptions):
+    return descriptions.astype(str).str.replace(r'\s+', ' ', regex=True).str.strip().str.casefold()
+
+
+# Returns a 64-bit fingerprint per row of (date, amount in cents, normalised description),
+# hashed by pandas in one vectorised pass
+def expense_fingerprints(df):
+    if not len(df):
+        return np.array([], dtype=np.uint64)
+    keys = pd.DataFrame({
+        'date': iso_dates(df['date']),
+        'cents': np.round(df['amount'].astype(float).to_numpy() * 100).astype(np.int64),
+        'description': normalize_descriptions(df['description']).to_numpy(),
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+class DuplicateIndex:
+    """Hash index of the expenses already stored, for rejecting re-imported rows.
+
+    Maps each (date, amount, normalised description) fingerprint to the number of
+    stored expenses that have it, so a lookup is one dict access per row. Like the
+    insight aggregates, it follows the store's version: rows appended by this
+    process are added in place, and the index is rebuilt from the store when the
+    version shows a change made elsewhere.
+
+    Counts rather than a plain set, so genuinely repeated expenses survive: a
+    statement with two identical coffees imports both, and importing it again adds
+    neither.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None  # Store version the counts correspond to; None = not built
+        self.counts = {}  # fingerprint -> number of stored expenses with it
+        self.rebuilds = 0
+
+    # Returns a boolean mask of the rows of `df` that are new. `seen` carries the state
+    # of one upload across its batches ({} to start one): the n-th occurrence of a
+    # fingerprint in an upload is a duplicate if the store held n or more of them when
+    # the upload first met that fingerprint.
+    def new_rows(self, store, df, seen):
+        fingerprints = expense_fingerprints(df)
+        keep = np.ones(len(fingerprints), dtype=bool)
+        with self._lock:
+            self._refresh(store)
+            counts = self.counts
+            for i, fingerprint in enumerate(fingerprints.tolist()):
+                occurrence, stored = seen.get(fingerprint) or (0, counts.get(fingerprint, 0))
+                keep[i] = occurrence >= stored
+                seen[fingerprint] = (occurrence + 1, stored)
+        return keep
+
+    def _refresh(self, store):
+        current = store.version()
+        if self.version is None or self.version != current:
+            with phase('dedup_rebuild'):
+                self._rebuild(store, current)
+
+    # `version` is read before the store is, so a write landing in between only
+    # causes another rebuild
+    def _rebuild(self, store, version):
+        fingerprints, counts = np.unique(expense_fingerprints(store.load()), return_counts=True)
+        self.counts = dict(zip(fingerprints.tolist(), counts.tolist()))
+        self.version = version
+        self.rebuilds += 1
+
+    # Adds newly appended typed rows; `before`/`after` are the store versions around
+    # the append (see ExpenseAggregates.apply)
+    def apply(self, df, before, after):
+        with self._lock:
+            if self.version is None or self.version != before:
+                self.version = None
+                return
+            counts = self.counts
+            for fingerprint in expense_fingerprints(df).tolist():
+                counts[fingerprint] = counts.get(fingerprint, 0) + 1
+            self.version = after
+
+    def stats(self):
+        with self._lock:
+            return {'rebuilds': self.rebuilds, 'fingerprints': len(self.counts),
+                    'built': self.version is not None}
@@ -0,0 +1,104 @@
+import threading
+
+import numpy as np
+
+from metrics import phase
+
+# Need at least 3 data points for a somewhat reliable linear trend; below that the
+# forecast is the average of the months available
+MIN_MONTHS_FOR_TREND = 3
+MAX_FORECAST_MONTHS = 24
+
+
+# Helper function to list the 'YYYY-MM' months from `first` to `last` inclusive
+def month_range(first, last):
+    return np.arange(np.datetime64(first, 'M'), np.datetime64(last, 'M') + 1).astype(str)
+
+
+# Turns {(category, 'YYYY-MM'): total} into a dense (categories x months) matrix covering
+# every calendar month from the first to the last expense, with 0 for months without any
+def monthly_matrix(category_month_totals):
+    if not category_month_totals:
+        return [], np.array([], dtype=str), np.zeros((0, 0))
+    categories = sorted({category for category, _ in category_month_totals})
+    observed_months = {month for _, month in category_month_totals}
+    months = month_range(min(observed_months), max(observed_months))
+    row = {category: i for i, category in enumerate(categories)}
+    col = {month: i for i, month in enumerate(months)}
+    count = len(category_month_totals)
+    rows = np.fromiter((row[c] for c, _ in category_month_totals), dtype=np.intp, count=count)
+    cols = np.fromiter((col[m] for _, m in category_month_totals), dtype=np.intp, count=count)
+    matrix = np.zeros((len(categories), len(months)))
+    matrix[rows, cols] = np.fromiter(category_month_totals.values(), dtype=float, count=count)
+    return categories, months, matrix
+
+
+# Fits y = intercept + slope * t (t = 0..n-1) to every row of `series` at once, with the
+# closed-form least-squares solution (the same fit LinearRegression would produce)
+def fit_linear_trends(series):
+    n = series.shape[1]
+    t = np.arange(n, dtype=float)
+    t_centered = t - t.mean()
+    means = series.mean(axis=1)
+    slopes = (series - means[:, None]) @ t_centered / (t_centered @ t_centered)
+    intercepts = means - slopes * t.mean()
+    return intercepts, slopes
+
+
+# Forecasts the next `horizon` months for every row of `series` (rows x months).
+# Returns (forecasts as rows x horizon, method name)
+def forecast_series(series, horizon):
+    n = series.shape[1]
+    if n < MIN_MONTHS_FOR_TREND:
+        return np.repeat(series.mean(axis=1)[:, None], horizon, axis=1), 'average'
+    intercepts, slopes = fit_linear_trends(series)
+    future_t = np.arange(n, n + horizon, dtype=float)
+    forecasts = intercepts[:, None] + slopes[:, None] * future_t[None, :]
+    return np.maximum(forecasts, 0), 'linear_trend'  # Expenses should not be negative
+
+
+class ForecastEngine:
+    """Per-category and total monthly spending forecasts, fitted in one batch.
+
+    Works from the aggregates' (category, month) totals rather than the expense rows,
+    and keeps fitted results for the current data version, so repeated calls until the
+    next write are dictionary lookups.
+    """
+
+    def __init__(self, aggregates):
+        self.aggregates = aggregates
+        self._lock = threading.Lock()
+        self._version = None
+        self._totals = {}  # (category, month) totals at self._version
+        self._results = {}  # horizon -> forecast dict for self._version
+        self.fits = 0
+
+    def forecast(self, store, horizon=1):
+        with self._lock:
+            version, totals = self.aggregates.category_month_totals(store, known_version=self._version)
+            if totals is not None:
+                self._version, self._totals, self._results = version, totals, {}
+            if horizon not in self._results:
+                with phase('forecast_fit'):
+                    self._results[horizon] = self._fit(self._totals, horizon)
+                self.fits += 1
+            return self._results[horizon]
+
+    @staticmethod
+    def _fit(totals, horizon):
+        categories, months, matrix = monthly_matrix(totals)
+        if not categories:
+            return {'history_months': 0, 'method': None, 'months': [], 'total': [], 'by_category': {}}
+        # The grand total is fitted on its own series (not summed from clipped category
+        # forecasts), as the last row of the same batch
+        series = np.vstack([matrix, matrix.sum(axis=0)])
+        forecasts, method = forecast_series(series, horizon)
+        last_month = np.datetime64(months[-1], 'M')
+        future_months = np.arange(last_month + 1, last_month + 1 + horizon).astype(str)
+        return {
+            'history_months': len(months),
+            'method': method,
+            'months': future_months.tolist(),
+            'total': forecasts[-1].tolist(),
+            'by_category': {category: forecasts[i].tolist() for i, category in enumerate(categories)},
+        }
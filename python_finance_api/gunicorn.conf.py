@@ -0,0 +1,41 @@
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+# Every setting can be overridden on the command line or through the environment below.
+import gc
+import glob
+import os
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# GUNICORN_PRELOAD=1 (default): the app is created once in the master and forked.
+# With EXPENSE_PRELOAD=1 (the default here) creating it also loads the expenses and
+# builds the insight totals (PRELOAD_DATA), so workers start with the data in memory
+# and share its pages copy-on-write until they write.
+# GUNICORN_PRELOAD=0 makes every worker import the app, and load the data, on its own.
+os.environ.setdefault('EXPENSE_PRELOAD', '1')
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Workers share their request metrics through this directory, so /api/metrics covers
+# all of them; it is cleared when the server starts
+os.environ.setdefault('EXPENSE_METRICS_DIR', os.path.join(tempfile.gettempdir(), f'finance-api-metrics-{os.getuid()}'))
+
+
+def on_starting(server):
+    for path in glob.glob(os.path.join(os.environ['EXPENSE_METRICS_DIR'], 'metrics-*.json')):
+        os.remove(path)
+
+
+if preload_app:
+    # Keep the collector from touching the preloaded objects: a collection in the master
+    # would only churn them, and one in a worker would write to (and so copy) the pages
+    # holding their GC headers. Everything alive at fork time is moved to the permanent
+    # generation, and collection resumes in the workers for their own objects.
+    gc.disable()
+
+    def pre_fork(server, worker):
+        gc.freeze()
+
+    def post_fork(server, worker):
+        gc.enable()
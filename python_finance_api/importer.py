@@ -0,0 +1,252 @@
+import csv
+import io
+import itertools
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from metrics import phase
+
+# Rows parsed, validated and committed per batch; bounds memory regardless of upload size
+IMPORT_CHUNK_ROWS = 20000
+# Failed rows echoed back in full; the rest are only counted
+MAX_REPORTED_FAILURES = 100
+
+# Define potential column names for flexibility
+COLUMN_CANDIDATES = {
+    'date_col': ['date', 'transaction date', 'posting date'],
+    'desc_col': ['description', 'narrative', 'details', 'transaction details', 'memo'],
+    'amount_col': ['amount', 'debit', 'value', 'expense'],  # Assumes positive values for expenses
+}
+REQUIRED_COLUMNS = ('date_col', 'amount_col')  # Date and Amount are essential
+DEFAULT_DESCRIPTION = "Uploaded via CSV"
+DEFAULT_CATEGORY = 'Uncategorized'  # Default category for uploaded expenses
+# A UTC offset after a time of day (Z, UTC, +01:00, -0500). Expenses keep the calendar
+# date as written, so the offset is dropped rather than converted to UTC
+UTC_OFFSET_PATTERN = re.compile(r'(\d:\d\d(?::\d\d(?:\.\d+)?)?)\s*(?:Z|UTC|[+-]\d\d(?::?\d\d)?)$', re.IGNORECASE)
+
+
+class CsvImportError(ValueError):
+    """The upload can't be imported at all (empty file, missing required column)."""
+
+
+# Helper function to find actual column name from a list of possibilities
+def find_column_name(df_columns, potential_names):
+    df_columns_lower = [col.lower() for col in df_columns]
+    for name in potential_names:
+        if name.lower() in df_columns_lower:
+            return df_columns[df_columns_lower.index(name.lower())]  # Return original casing
+    return None
+
+
+# Helper function to map our logical columns onto the upload's header
+def resolve_columns(header):
+    actual_cols = {}
+    for key, potentials in COLUMN_CANDIDATES.items():
+        found_col = find_column_name(header, potentials)
+        if not found_col and key in REQUIRED_COLUMNS:
+            raise CsvImportError(f'Missing required column. Could not find a column for: '
+                                 f'{key.replace("_col", "")}. Expected one of {potentials}')
+        actual_cols[key] = found_col
+    return actual_cols
+
+
+# Generates `count` random (version 4) UUID strings in one go; calling uuid.uuid4()
+# per row costs more than parsing and validating the row itself
+def new_expense_ids(count):
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # Version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_ids = raw.tobytes().hex()
+    return [f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+            for h in (hex_ids[i:i + 32] for i in range(0, len(hex_ids), 32))]
+
+
+# Helper function to parse dates to naive timestamps, keeping the wall-clock time of any
+# that still carry a timezone. Values in several timezones can't share a column, so they
+# are parsed one by one.
+def _naive_dates(values, **kwargs):
+    try:
+        dates = pd.to_datetime(values, errors='coerce', **kwargs)
+    except ValueError:  # Mixed timezones
+        dates = [pd.to_datetime(value, errors='coerce') for value in values]
+        dates = pd.Series([d.tz_localize(None) if d.tzinfo else d for d in dates],
+                          index=values.index, dtype='datetime64[ns]')
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates
+
+
+# Parses a column of dates: one fast pass with the format inferred from the column,
+# then a per-value pass only for the values that pass didn't understand
+def parse_dates(values):
+    values = values.str.replace(UTC_OFFSET_PATTERN, r'\1', regex=True)
+    dates = _naive_dates(values)
+    retry = dates.isna() & (values != '')
+    if retry.any():
+        dates[retry] = _naive_dates(values[retry], format='mixed')
+    return dates
+
+
+# Validates one chunk with whole-column operations.
+# Returns the new expense rows and the failure reason per row ('' for valid rows).
+def validate_chunk(chunk, actual_cols):
+    dates = parse_dates(chunk[actual_cols['date_col']].str.strip())
+    amounts = pd.to_numeric(chunk[actual_cols['amount_col']].str.strip(), errors='coerce')
+    if actual_cols['desc_col']:
+        # Description is optional in the CSV, default it when the column or the value is empty
+        raw_descriptions = chunk[actual_cols['desc_col']]
+        descriptions = raw_descriptions.where(raw_descriptions != '', DEFAULT_DESCRIPTION)
+    else:
+        descriptions = pd.Series(DEFAULT_DESCRIPTION, index=chunk.index)
+
+    bad_date = dates.isna()
+    bad_amount = ~bad_date & ~np.isfinite(amounts)  # Unparseable amounts are NaN
+    not_positive = ~bad_date & ~bad_amount & (amounts <= 0)  # Expenses should be positive amounts
+    reasons = pd.Series(np.select(
+        [bad_date, bad_amount, not_positive],
+        ['Error parsing row: invalid date.', 'Error parsing row: invalid amount.',
+         'Amount must be a positive value for an expense.'],
+        default=''), index=chunk.index)
+    valid = (reasons == '').to_numpy()
+
+    count = int(valid.sum())
+    new_expenses = pd.DataFrame({
+        'id': new_expense_ids(count),
+        'date': dates[valid].dt.normalize().to_numpy(),
+        'category': DEFAULT_CATEGORY,
+        'amount': amounts[valid].astype(float).to_numpy(),
+        'description': descriptions[valid].to_numpy(),
+    })
+    return new_expenses, reasons
+
+
+# Helper function to make repeated column names unique the way pandas does
+# (Amount, Amount.1, ...), so each name selects exactly one column
+def unique_names(header):
+    names = []
+    for name in header:
+        candidate, n = name, 0
+        while candidate in names:
+            n += 1
+            candidate = f'{name}.{n}'
+        names.append(candidate)
+    return names
+
+
+# Helper function to read and check the upload's header line.
+# Returns (header, actual_cols); raises CsvImportError if the upload can't be imported.
+def read_header(text):
+    header_line = text.readline()
+    if not header_line.strip():
+        raise CsvImportError('Uploaded CSV file is empty.')
+    header = unique_names(next(csv.reader([header_line])))
+    return header, resolve_columns(header)
+
+
+# Helper function to read the rows after the header, `chunk_rows` at a time.
+# Yields (chunk, too_long): the rows as text columns indexed by the line each starts on
+# (the header is line 1; short rows are padded with ''), and {line: fields} for rows with
+# more fields than the header, which are left out of the chunk. Blank lines are skipped.
+# pandas' C parser drops or shifts extra fields without telling us, so records are
+# split by the csv module instead.
+def read_chunks(text, header, chunk_rows):
+    reader = csv.reader(text)
+    width = len(header)
+    end = 1
+    while True:
+        row_numbers, rows, too_long = [], [], {}
+        done = True
+        for record in itertools.islice(reader, chunk_rows):
+            done = False
+            start, end = end + 1, reader.line_num + 1
+            if len(record) == width:
+                row_numbers.append(start)
+                rows.append(record)
+            elif len(record) > width:
+                too_long[start] = record
+            elif record and (len(record) > 1 or record[0].strip()):
+                row_numbers.append(start)
+                rows.append(record + [''] * (width - len(record)))
+        if done:
+            return
+        chunk = pd.DataFrame(rows, columns=header, index=row_numbers, dtype=str)
+        yield chunk, too_long
+
+
+def _text(stream):
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+
+
+# Checks only the header of an upload (binary file object), so it can be rejected
+# before a background import is queued
+def check_csv_header(stream):
+    read_header(_text(stream))
+
+
+# Streams an uploaded CSV into the store.
+# `stream` is a binary file object; `append_batch(df)` commits one batch of typed rows and
+# may return how many of them it actually added (the rest count as duplicates).
+# Nothing is written if the header is unusable; otherwise every valid row is committed
+# batch by batch, and failures are counted with the first `max_reported_failures` echoed back.
+# `on_progress(result)`, if given, is called after every batch with the counts so far.
+def import_expenses_csv(stream, append_batch, chunk_rows=IMPORT_CHUNK_ROWS,
+                        max_reported_failures=MAX_REPORTED_FAILURES, on_progress=None):
+    text = _text(stream)
+    header, actual_cols = read_header(text)
+
+    imported_count = 0
+    duplicate_count = 0
+    failed_count = 0
+    failed_rows_details = []
+    # Everything is read as text: no type guessing per chunk, and failed rows echo back as uploaded
+    chunks = read_chunks(text, header, chunk_rows)
+    while True:
+        with phase('import_parse'):
+            chunk, too_long = next(chunks, (None, None))
+        if chunk is None:
+            break
+
+        with phase('import_validate'):
+            new_expenses, reasons = validate_chunk(chunk, actual_cols)
+        if len(new_expenses):
+            with phase('import_append'):
+                added = append_batch(new_expenses)
+            added = len(new_expenses) if added is None else added
+            imported_count += added
+            duplicate_count += len(new_expenses) - added
+
+        failed = reasons[reasons != '']
+        if too_long:
+            failed = pd.concat([failed, pd.Series(
+                [f'Error parsing row: expected {len(header)} fields, saw {len(record)}.'
+                 for record in too_long.values()], index=list(too_long))]).sort_index()
+        failed_count += len(failed)
+        room = max(max_reported_failures - len(failed_rows_details), 0)
+        for row_number, reason in failed.iloc[:room].items():
+            if row_number in too_long:
+                record = too_long[row_number]
+                data = {**dict(zip(header, record)), 'extra_fields': record[len(header):]}
+            else:
+                data = chunk.loc[row_number].to_dict()
+            failed_rows_details.append({
+                'row_number': int(row_number),
+                'data': data,
+                'reason': reason,
+            })
+        if on_progress:
+            on_progress(_result(imported_count, duplicate_count, failed_count, failed_rows_details))
+
+    return _result(imported_count, duplicate_count, failed_count, failed_rows_details)
+
+
+def _result(imported_count, duplicate_count, failed_count, failed_rows_details):
+    return {
+        'imported_count': imported_count,
+        'duplicate_count': duplicate_count,
+        'failed_count': failed_count,
+        'failed_rows_details': list(failed_rows_details),
+        'failed_rows_truncated': failed_count > len(failed_rows_details),
+    }
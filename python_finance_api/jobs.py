@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from storage import atomic_replace
+
+logger = logging.getLogger(__name__)
+
+# Imports running at once per worker process; more are queued
+IMPORT_WORKERS = 2
+# Status files of finished jobs are kept this long, then removed on a later submit
+JOB_RETENTION_SECONDS = 24 * 3600
+# A running job that hasn't reported progress for this long is presumed dead
+JOB_STALE_SECONDS = 15 * 60
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, TypeError):  # Exists but isn't ours, or no pid recorded
+        return True
+    return True
+
+
+class ImportJobs:
+    """CSV imports run in the background on a small thread pool.
+
+    Each job's status is a JSON file in `directory`, rewritten atomically as the
+    import progresses, so any worker process can answer a status request, not
+    only the one running the import. The upload is spooled to disk next to it
+    and removed once the job finishes. Each job records the process that runs it
+    and when it last reported, so a job orphaned by a crashed or restarted worker
+    is reported as failed instead of staying queued or running forever.
+    """
+
+    def __init__(self, directory, max_workers=IMPORT_WORKERS):
+        self.directory = directory
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    # Threads don't survive a fork, so each worker (including one forked from a
+    # preloaded gunicorn master) starts its own pool on first use
+    def _pool(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='import')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.directory, job_id + suffix)
+
+    def _write(self, job):
+        job['updated_at'] = _now()
+        data = json.dumps(job).encode()
+
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        atomic_replace(self._path(job['id'], '.json'), write)
+
+    # Queues an import of `upload` (a werkzeug FileStorage) for `owner` (a user id, with
+    # per-user storage) and returns the new job.
+    # `check(stream)` runs on the spooled file before anything is queued, so an unusable
+    # upload can be rejected right away (its exception propagates);
+    # `run(stream, on_progress)` does the import in the background and returns its result.
+    def submit(self, upload, run, check=None, owner=None):
+        self._expire()
+        job_id = uuid.uuid4().hex
+        upload_path = self._path(job_id, '.csv')
+        upload.save(upload_path)
+        try:
+            if check:
+                with open(upload_path, 'rb') as stream:
+                    check(stream)
+        except BaseException:
+            os.remove(upload_path)
+            raise
+        bytes_total = os.path.getsize(upload_path)
+        job = {
+            'id': job_id,
+            'owner': owner,
+            'worker': {'host': socket.gethostname(), 'pid': os.getpid()},
+            'status': 'queued',  # -> running -> completed | failed
+            'filename': upload.filename,
+            'created_at': _now(),
+            'started_at': None,
+            'finished_at': None,
+            'progress': {'bytes_read': 0, 'bytes_total': bytes_total, 'percent': 0.0,
+                         'imported_count': 0, 'duplicate_count': 0, 'failed_count': 0},
+            'result': None,
+            'error': None,
+        }
+        self._write(job)
+        self._pool().submit(self._run, job, upload_path, run)
+        return job
+
+    # Returns the job's latest status, or None for an unknown (or expired) job id or
+    # another owner's job
+    def get(self, job_id, owner=None):
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id, '.json')) as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return None
+        if job.get('owner') != owner:
+            return None
+        reason = self._abandoned(job)
+        if reason:
+            job.update(status='failed', error=reason)
+        return job
+
+    # Why an unfinished job will never finish, or None: its worker process is gone (only
+    # checked on the host that ran it), or it stopped reporting progress
+    def _abandoned(self, job):
+        if job['status'] not in ('queued', 'running'):
+            return None
+        worker = job.get('worker') or {}
+        if worker.get('host') == socket.gethostname() and not _process_alive(worker.get('pid')):
+            return 'The server process running the import stopped before it finished. Please upload the file again.'
+        updated_at = datetime.fromisoformat(job.get('updated_at') or job['created_at']).timestamp()
+        if job['status'] == 'running' and time.time() - updated_at > JOB_STALE_SECONDS:
+            return 'The import stopped reporting progress. Please upload the file again.'
+        return None
+
+    def _run(self, job, upload_path, run):
+        job.update(status='running', started_at=_now())
+        self._write(job)
+        progress = job['progress']
+        try:
+            with open(upload_path, 'rb') as stream:
+                def on_progress(counts):
+                    progress['bytes_read'] = min(stream.tell(), progress['bytes_total'])
+                    progress['percent'] = round(100.0 * progress['bytes_read'] / max(progress['bytes_total'], 1), 1)
+                    for key in ('imported_count', 'duplicate_count', 'failed_count'):
+                        progress[key] = counts[key]
+                    self._write(job)
+                result = run(stream, on_progress)
+            progress.update(bytes_read=progress['bytes_total'], percent=100.0)
+            for key in ('imported_count', 'duplicate_count', 'failed_count'):
+                progress[key] = result[key]
+            job.update(status='completed', result=result)
+        except Exception as e:
+            logger.exception('Import job %s failed', job['id'])
+            job.update(status='failed', error=str(e))
+        finally:
+            job['finished_at'] = _now()
+            self._write(job)
+            os.remove(upload_path)
+
+    # Removes status files (and any orphaned uploads) older than the retention period
+    def _expire(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,268 @@
+import atexit
+import bisect
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask.json.provider import DefaultJSONProvider
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# How often a process writes its metrics for the others to merge (METRICS_DIR only)
+SNAPSHOT_INTERVAL_SECONDS = 1.0
+
+# Phase durations of the request (or background job) running in this context
+_current_phases = contextvars.ContextVar('phases', default=None)
+
+
+# Times a block as one phase of the current request: phase('store'), phase('serialize'), ...
+# Phases may nest (a rebuild inside an aggregate lookup); each records its own full time.
+# Outside a tracked request or job it does nothing.
+@contextmanager
+def phase(name):
+    phases = _current_phases.get()
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+# Wraps a response generator so the time spent producing each chunk counts towards
+# `name`; streamed bodies are generated after the view has returned, so the current
+# request's phases are looked up now rather than on the first chunk
+def timed_chunks(name, chunks):
+    phases = _current_phases.get()
+    if phases is None:
+        return chunks
+    return _timed_chunks(phases, name, iter(chunks))
+
+
+def _timed_chunks(phases, name, chunks):
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+            return
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+        yield chunk
+
+
+# JSON provider that counts jsonify() towards the 'serialize' phase
+class TimedJSONProvider(DefaultJSONProvider):
+    def response(self, *args, **kwargs):
+        with phase('serialize'):
+            return super().response(*args, **kwargs)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+    def merge(self, data):
+        self.counts = [a + b for a, b in zip(self.counts, data['counts'])]
+        self.sum += data['sum']
+        self.count += data['count']
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+class RequestMetrics:
+    """Request counts, per-route latency histograms and per-route phase histograms.
+
+    Kept per process. With `directory` set (METRICS_DIR), every process also writes
+    its numbers there: a background thread writes them within
+    SNAPSHOT_INTERVAL_SECONDS of any new observation (and at exit), and the process
+    answering /api/metrics writes its own first. render() merges all of them, so
+    /api/metrics covers every gunicorn worker whichever one answers it. Each file
+    only ever moves forward, so merged counters never go down between scrapes.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.requests = {}  # (route, method, status) -> count
+        self.latency = {}  # (route, method) -> Histogram
+        self.phases = {}  # (route, phase) -> Histogram
+        self._dirty = False  # Observations not written to the snapshot file yet
+        self._write_lock = threading.Lock()
+        self._flusher_pid = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # Tracks the phases of everything run inside the block, e.g. a background import,
+    # and records it like a request to `route`
+    @contextmanager
+    def track(self, route, method):
+        token = _current_phases.set({})
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            phases = _current_phases.get()
+            _current_phases.reset(token)
+            self.observe(route, method, status, time.perf_counter() - start, phases)
+
+    def observe(self, route, method, status, seconds, phases):
+        with self._lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault((route, method), Histogram()).observe(seconds)
+            for name, phase_seconds in phases.items():
+                self.phases.setdefault((route, name), Histogram()).observe(phase_seconds)
+            self._dirty = True
+        if self.directory and self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    # Threads don't survive a fork, so each process starts its own on first use
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+        atexit.register(self._flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL_SECONDS)
+            self._flush()
+
+    def _flush(self):
+        if self._dirty and self._flusher_pid == os.getpid():
+            self.write_snapshot()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': [[*key, count] for key, count in self.requests.items()],
+                'latency': [[*key, h.to_dict()] for key, h in self.latency.items()],
+                'phases': [[*key, h.to_dict()] for key, h in self.phases.items()],
+            }
+
+    # Writes go one at a time, each with numbers taken after the previous write, so an
+    # older snapshot can never replace a newer one
+    def write_snapshot(self):
+        from storage import atomic_replace
+        with self._write_lock:
+            with self._lock:
+                self._dirty = False
+            data = json.dumps(self.snapshot()).encode()
+
+            def write(tmp_path):
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+            atomic_replace(os.path.join(self.directory, f'metrics-{os.getpid()}.json'), write)
+
+    # This process's numbers, plus every other process's latest snapshot with METRICS_DIR
+    def _collect(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.write_snapshot()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # Replaced or removed while we were reading
+        return snapshots
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        requests, latency, phases = {}, {}, {}
+        for snapshot in self._collect():
+            for route, method, status, count in snapshot['requests']:
+                requests[(route, method, status)] = requests.get((route, method, status), 0) + count
+            for target, rows in ((latency, snapshot['latency']), (phases, snapshot['phases'])):
+                for first, second, data in rows:
+                    target.setdefault((first, second), Histogram()).merge(data)
+
+        lines = ['# HELP finance_api_requests_total Requests handled, by route, method and status.',
+                 '# TYPE finance_api_requests_total counter']
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'finance_api_requests_total{{{_labels(route=route, method=method, status=status)}}} {count}')
+        lines += ['# HELP finance_api_request_duration_seconds Request latency, by route and method.',
+                  '# TYPE finance_api_request_duration_seconds histogram']
+        for (route, method), histogram in sorted(latency.items()):
+            lines += self._histogram_lines('finance_api_request_duration_seconds', histogram,
+                                           route=route, method=method)
+        lines += ['# HELP finance_api_request_phase_seconds Time spent in each phase of a request, by route '
+                  'and phase. Phases may nest.',
+                  '# TYPE finance_api_request_phase_seconds histogram']
+        for (route, name), histogram in sorted(phases.items()):
+            lines += self._histogram_lines('finance_api_request_phase_seconds', histogram,
+                                           route=route, phase=name)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram_lines(name, histogram, **labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip([*map(repr, histogram.buckets), '+Inf'], histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{_labels(**labels, le=bound)}}} {cumulative}')
+        lines.append(f'{name}_sum{{{_labels(**labels)}}} {histogram.sum!r}')
+        lines.append(f'{name}_count{{{_labels(**labels)}}} {histogram.count}')
+        return lines
+
+    # Times every request of `app`: the clock stops when the response has been sent,
+    # so streamed bodies are included
+    def init_app(self, app):
+        from flask import g, request
+
+        app.json = TimedJSONProvider(app)
+
+        @app.before_request
+        def start_request_timer():
+            g.metrics_start = time.perf_counter()
+            g.metrics_phases = {}
+            g.metrics_token = _current_phases.set(g.metrics_phases)
+
+        @app.after_request
+        def record_request(response):
+            start, phases = g.get('metrics_start'), g.get('metrics_phases')
+            if start is not None:
+                route = request.url_rule.rule if request.url_rule else 'unmatched'
+                method, status = request.method, response.status_code
+                response.call_on_close(
+                    lambda: self.observe(route, method, status, time.perf_counter() - start, phases))
+            return response
+
+        @app.teardown_request
+        def reset_phases(exc):
+            token = g.pop('metrics_token', None)
+            if token is not None:
+                _current_phases.reset(token)
@@ -0,0 +1,75 @@
+import base64
+import json
+import math
+
+import pandas as pd
+
+from storage import EXPENSE_COLUMNS, iso_dates
+
+# Rows serialised per chunk of a streamed response; bounds the size of each piece
+# of output held in memory at once
+STREAM_CHUNK_ROWS = 5000
+
+
+# Helper function to give a typed expense table its JSON shape (dates as 'YYYY-MM-DD')
+def _json_ready(df):
+    return df[EXPENSE_COLUMNS].assign(date=iso_dates(df['date']))
+
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield _json_ready(df.iloc[start:start + chunk_rows])
+
+
+# Yields the rows as newline-delimited JSON, written chunk by chunk by pandas' C
+# JSON encoder instead of building a Python dict per row
+def iter_ndjson(df, chunk_rows=STREAM_CHUNK_ROWS):
+    for chunk in _chunks(df, chunk_rows):
+        yield chunk.to_json(orient='records', lines=True)
+
+
+# Yields the rows as one JSON array, optionally wrapped in an object:
+# iter_json_array(df, 'expenses', {'next_cursor': ...}) -> {"expenses": [...], "next_cursor": ...}
+def iter_json_array(df, key=None, extra=None, chunk_rows=STREAM_CHUNK_ROWS):
+    yield '{%s:[' % json.dumps(key) if key else '['
+    separator = ''
+    for chunk in _chunks(df, chunk_rows):
+        yield separator + chunk.to_json(orient='records')[1:-1]
+        separator = ','
+    if key:
+        tail = ''.join(',%s:%s' % (json.dumps(k), json.dumps(v)) for k, v in (extra or {}).items())
+        yield ']' + tail + '}'
+    else:
+        yield ']'
+
+
+# --- Keyset cursors ---
+# A cursor is the (sort value, id) of the last row of a page, made URL-safe
+
+def encode_cursor(row, sort):
+    value = row[sort]
+    value = value.strftime('%Y-%m-%d') if sort == 'date' else float(value)
+    raw = json.dumps([value, str(row['id'])], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# Raises ValueError for anything that isn't a cursor for this sort column
+def decode_cursor(token, sort):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, last_id = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(last_id, str):
+        raise ValueError('Invalid cursor')
+    if sort == 'date':
+        # Only the plain dates encode_cursor writes: no times, offsets or 'NaT'
+        if not isinstance(value, str):
+            raise ValueError('Invalid cursor')
+        value = pd.to_datetime(value, format='%Y-%m-%d', errors='coerce')
+        if pd.isna(value):
+            raise ValueError('Invalid cursor')
+        return value, last_id
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError('Invalid cursor')
+    return float(value), last_id
@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+from aggregates import ExpenseAggregates
+from dedup import DuplicateIndex
+from forecasting import ForecastEngine
+from storage import EXPENSE_COLUMNS, UserPartitions, open_store, parse_expenses, single_line_text
+
+# Users whose state is kept in memory at once per process (least recently used dropped first)
+MAX_OPEN_PARTITIONS = 256
+
+
+class ExpenseState:
+    """Everything one store's expenses are served from: the store, the running
+    insight totals, the forecast engine and the duplicate index used by imports.
+
+    An app has one for the shared store, or one per user with partitioned storage
+    (see UserStates). Built lazily on the first request that needs it, or up front
+    by create_app() when PRELOAD_DATA is set, so that a pre-forking server can load
+    the data once in the master and share it with its workers.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # Running totals for the insight endpoints, kept in step with our own appends
+        self.aggregates = ExpenseAggregates()
+        # Spending forecasts, refitted only when the data version changes
+        self.forecasts = ForecastEngine(self.aggregates)
+        # Fingerprints of the stored expenses, so re-uploaded statements aren't imported twice
+        self.duplicates = DuplicateIndex()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(open_store(config['STORAGE_BACKEND'], config['STORAGE_PATH'], base_dir=config['BASE_DIR']))
+
+    # Reads the data and builds the totals now rather than on the first request
+    def warm(self):
+        self.store.load()
+        self.aggregates.snapshot(self.store)
+
+    # Adds new expenses without rewriting the existing ones
+    def append(self, new_expenses_df):
+        new_expenses_df = single_line_text(parse_expenses(new_expenses_df[EXPENSE_COLUMNS]))
+        before, after = self.store.append(new_expenses_df)
+        self.aggregates.apply(new_expenses_df, before, after)
+        self.duplicates.apply(new_expenses_df, before, after)
+        # No-op unless the backend needs housekeeping. A compaction rewrites the files but
+        # not the rows, so the totals and the index only move to the new version
+        compacted = self.store.compact()
+        if compacted:
+            self.aggregates.apply(new_expenses_df.iloc[:0], *compacted)
+            self.duplicates.apply(new_expenses_df.iloc[:0], *compacted)
+
+    # Appends only the rows not already stored; `seen` tracks one upload across its
+    # batches (see DuplicateIndex.new_rows). Returns the number of rows added.
+    # The store's import lock is held from the index's version check to the end of the
+    # append, so batches of concurrent imports, in any worker, go one at a time and each
+    # is checked against everything appended before it.
+    def append_new(self, new_expenses_df, seen):
+        with self.store.import_lock():
+            new_expenses_df = new_expenses_df[self.duplicates.new_rows(self.store, new_expenses_df, seen)]
+            if len(new_expenses_df):
+                self.append(new_expenses_df)
+            return len(new_expenses_df)
+
+    # Full rewrite, atomic
+    def replace(self, df):
+        self.store.replace(single_line_text(parse_expenses(df[EXPENSE_COLUMNS])))
+
+    def stats(self):
+        return {**self.store.stats(), 'aggregates': self.aggregates.stats(),
+                'forecast_fits': self.forecasts.fits, 'duplicates': self.duplicates.stats()}
+
+
+class UserStates:
+    """Per-user ExpenseStates over partitioned storage, opened on demand.
+
+    Only the most recently used `max_open` users are kept in memory; a dropped
+    user's state is rebuilt from their partition when they come back.
+    """
+
+    def __init__(self, partitions, max_open=MAX_OPEN_PARTITIONS):
+        self.partitions = partitions
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._states = OrderedDict()  # user id -> ExpenseState, least recently used first
+        self.opened = 0
+
+    @classmethod
+    def from_config(cls, config):
+        partitions = UserPartitions(config['PARTITIONS_DIR'], config['STORAGE_BACKEND'],
+                                    sharded=config['PARTITION_SHARDED'])
+        return cls(partitions, config['MAX_OPEN_PARTITIONS'] or MAX_OPEN_PARTITIONS)
+
+    def get(self, user_id):
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is not None:
+                self._states.move_to_end(user_id)
+                return state
+        # Opened outside the lock so one user's slow open doesn't hold up the others
+        state = ExpenseState(self.partitions.open(user_id))
+        with self._lock:
+            current = self._states.setdefault(user_id, state)
+            if current is state:
+                self.opened += 1
+            self._states.move_to_end(user_id)
+            if len(self._states) > self.max_open:
+                self._states.popitem(last=False)
+            return current
+
+    # Loads the partitions of the first `max_open` users up front (see ExpenseState.warm)
+    def warm(self):
+        for count, user_id in enumerate(self.partitions.user_ids()):
+            if count >= self.max_open:
+                break
+            self.get(user_id).warm()
+
+    def stats(self):
+        with self._lock:
+            return {'open': len(self._states), 'max_open': self.max_open, 'opened': self.opened,
+                    'backend': self.partitions.backend, 'sharded': self.partitions.sharded}
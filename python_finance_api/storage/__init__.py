@@ -0,0 +1,39 @@
+import os
+
+from .base import (EXPENSE_COLUMNS, SORT_COLUMNS, ExpenseStore, atomic_replace, empty_expenses_frame,
+                   expense_file_lock, filter_expenses, iso_dates, iso_months, keyset_slice, parse_expenses,
+                   single_line_text)
+from .csv_store import CsvExpenseStore, ExpenseCache
+from .partitions import PARTITION_SUFFIXES, UserPartitions, split_expenses, validate_user_id
+
+BACKENDS = ('csv', 'sqlite', 'parquet')
+
+# Default location of each backend's data, relative to the API directory
+DEFAULT_PATHS = {
+    'csv': 'expenses.csv',
+    'sqlite': 'expenses.sqlite3',
+    'parquet': 'expenses_parquet',
+}
+# Default root of the per-user partitions (see UserPartitions)
+DEFAULT_PARTITIONS_DIR = 'users'
+
+
+# Helper function to open the configured storage backend
+def open_store(backend='csv', path=None, base_dir='.'):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'. Expected one of {BACKENDS}")
+    path = path or os.path.join(base_dir, DEFAULT_PATHS[backend])
+    if backend == 'sqlite':
+        from .sqlite_store import SqliteExpenseStore
+        return SqliteExpenseStore(path)
+    if backend == 'parquet':
+        from .parquet_store import ParquetExpenseStore
+        return ParquetExpenseStore(path)
+    return CsvExpenseStore(path)
+
+
+# Copies every expense from one store into another, replacing its contents
+def migrate_expenses(source, destination):
+    df = source.load()
+    destination.replace(df)
+    return len(df)
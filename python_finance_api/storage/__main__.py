@@ -0,0 +1,92 @@
+# One-shot conversion between storage backends, e.g.
+#   python -m storage migrate --to sqlite
+#   python -m storage migrate --from csv --source old.csv --to parquet --dest data/expenses_parquet
+# and splitting the shared data into per-user partitions, e.g.
+#   python -m storage split --user 1                      (everything belongs to user 1)
+#   python -m storage split --owner-map owners.csv --sharded --to sqlite
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from . import (BACKENDS, DEFAULT_PARTITIONS_DIR, UserPartitions, migrate_expenses, open_store, split_expenses,
+               validate_user_id)
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+# Works out the owner of every expense for `split`. Returns a Series of user ids aligned
+# with `df`, or raises ValueError naming the expenses that have none.
+def expense_owners(df, source, user=None, owner_column=None, owner_map=None, default_user=None):
+    if user is not None:
+        return pd.Series(validate_user_id(user), index=df.index)
+    if owner_column:
+        if source.name != 'csv':
+            raise ValueError('--owner-column needs a csv source')
+        # The stores only hand back the expense columns, so the owner is read from the file itself
+        owned = pd.read_csv(source.path, usecols=['id', owner_column], dtype=str, keep_default_na=False)
+        mapping = owned.set_index('id')[owner_column]
+    else:
+        mapping = pd.read_csv(owner_map, usecols=['id', 'user_id'], dtype=str,
+                              keep_default_na=False).set_index('id')['user_id']
+    mapping = mapping[mapping != '']
+    mapping = mapping[~mapping.index.duplicated(keep='last')]
+    owners = df['id'].map(mapping)
+    if default_user is not None:
+        owners = owners.fillna(validate_user_id(default_user))
+    missing = df.loc[owners.isna(), 'id']
+    if len(missing):
+        sample = ', '.join(missing.iloc[:5])
+        raise ValueError(f'{len(missing)} expenses have no owner (e.g. {sample}); '
+                         'map them or pass --default-user')
+    return owners
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m storage', description='Expense storage tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('migrate', help='Copy all expenses into another storage backend')
+    migrate.add_argument('--from', dest='source_backend', choices=BACKENDS, default='csv')
+    migrate.add_argument('--source', help='Path of the existing data (defaults to the backend default)')
+    migrate.add_argument('--to', dest='dest_backend', choices=BACKENDS, required=True)
+    migrate.add_argument('--dest', help='Path of the new data (defaults to the backend default)')
+
+    split = commands.add_parser('split', help='Split the shared expenses into one partition per user')
+    split.add_argument('--from', dest='source_backend', choices=BACKENDS, default='csv')
+    split.add_argument('--source', help='Path of the shared data (defaults to the backend default)')
+    split.add_argument('--to', dest='dest_backend', choices=BACKENDS, default='csv')
+    split.add_argument('--dest-dir', help=f'Root of the partitions (default: {DEFAULT_PARTITIONS_DIR}/)')
+    split.add_argument('--sharded', action='store_true', help='Use the hash-sharded directory layout')
+    owner = split.add_mutually_exclusive_group(required=True)
+    owner.add_argument('--user', help='Give every expense to this user')
+    owner.add_argument('--owner-column', help='Column of the source csv holding each expense\'s user id')
+    owner.add_argument('--owner-map', help='CSV file with id,user_id columns mapping expenses to users')
+    split.add_argument('--default-user', help='Owner of expenses the column or map has no user for')
+    args = parser.parse_args(argv)
+
+    source = open_store(args.source_backend, args.source, base_dir=BASE_DIR)
+    if args.command == 'split':
+        partitions = UserPartitions(args.dest_dir or os.path.join(BASE_DIR, DEFAULT_PARTITIONS_DIR),
+                                    args.dest_backend, sharded=args.sharded)
+        df = source.load()
+        try:
+            owners = expense_owners(df, source, args.user, args.owner_column, args.owner_map, args.default_user)
+            counts = split_expenses(df, owners, partitions)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Split {len(df)} expenses from {source.path} ({source.name}) into {len(counts)} "
+              f"{'sharded ' if args.sharded else ''}{partitions.backend} partitions under {partitions.root}")
+        return 0
+
+    destination = open_store(args.dest_backend, args.dest, base_dir=BASE_DIR)
+    if source.path == destination.path:
+        parser.error('source and destination are the same')
+    count = migrate_expenses(source, destination)
+    print(f"Migrated {count} expenses from {source.path} ({source.name}) "
+          f"to {destination.path} ({destination.name})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
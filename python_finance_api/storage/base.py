@@ -0,0 +1,237 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl  # POSIX advisory locks, shared by every process using the file
+except ImportError:  # pragma: no cover - Windows has no fcntl
+    fcntl = None
+
+# Copy-on-Write is always on from pandas 3.0; on older versions turn it on so the
+# shallow copies handed out by the stores can never write through to cached data.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+EXPENSE_COLUMNS = ['id', 'date', 'category', 'amount', 'description']
+SORT_COLUMNS = ('date', 'amount')  # Columns a listing can be ordered by (ties broken by id)
+
+
+# Helper function to build an empty, correctly shaped expense table
+def empty_expenses_frame():
+    return pd.DataFrame(columns=EXPENSE_COLUMNS)
+
+
+# Helper function to turn raw stored columns into the typed table the routes work with
+def parse_expenses(df):
+    # Stored dates are ISO 8601, but older rows carry a time part and newer ones don't,
+    # so the format must not be inferred from the first row alone
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601', errors='coerce')
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce')
+    df = df.dropna(subset=['date', 'amount'])  # Drop rows where conversion failed
+    df['id'] = df['id'].astype(str)  # Old rows have numeric ids; keep the column sortable
+    df['amount'] = df['amount'].replace([np.inf, -np.inf], 0)
+    df['description'] = df['description'].fillna("")
+    df['category'] = df['category'].fillna("Uncategorized")
+    return df.reset_index(drop=True)
+
+
+# Helper function to keep the text columns on one line: line breaks become spaces.
+# The csv backend finds record boundaries by newlines, and no expense needs them
+def single_line_text(df):
+    for column in ('category', 'description'):
+        values = df[column]
+        broken = values.astype(str).str.contains('[\r\n]', regex=True)
+        if broken.any():
+            fixed = values[broken].astype(str).str.replace(r'[\r\n]+', ' ', regex=True)
+            df = df.assign(**{column: values.where(~broken, fixed)})
+    return df
+
+
+# Helper functions to format a datetime column as 'YYYY-MM-DD' / 'YYYY-MM' strings.
+# Casting through numpy's calendar units is far cheaper than Series.dt.strftime.
+def iso_dates(dates):
+    return dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(str)
+
+
+def iso_months(dates):
+    return dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]').astype(str)
+
+
+# Helper function to apply the optional query filters to a typed table
+def filter_expenses(df, **filters):
+    mask = filter_mask(df, **filters)
+    return df if mask.all() else df[mask]
+
+
+# Boolean Series of the rows of `df` matching the query filters
+def filter_mask(df, start_date=None, end_date=None, categories=None, min_amount=None, max_amount=None):
+    mask = pd.Series(True, index=df.index)
+    if start_date is not None:
+        mask &= df['date'] >= start_date
+    if end_date is not None:
+        mask &= df['date'] <= end_date
+    if categories:
+        mask &= df['category'].isin(categories)
+    if min_amount is not None:
+        mask &= df['amount'] >= min_amount
+    if max_amount is not None:
+        mask &= df['amount'] <= max_amount
+    return mask
+
+
+# Helper function for keyset pagination over a table already ordered by (sort, id):
+# keeps the rows strictly after the cursor `after` = (sort value, id), then the first `limit`
+def keyset_slice(df, sort, descending=False, after=None, limit=None):
+    if after is not None:
+        df = df[keyset_mask(df, sort, descending, after)]
+    return df if limit is None else df.iloc[:limit]
+
+
+# Boolean Series of the rows of `df`, in any order, that come after the cursor `after`
+def keyset_mask(df, sort, descending, after):
+    value, last_id = after
+    if descending:
+        return (df[sort] < value) | ((df[sort] == value) & (df['id'] < last_id))
+    return (df[sort] > value) | ((df[sort] == value) & (df['id'] > last_id))
+
+
+# --- Locking and Atomic Writes ---
+
+# path -> [lock, threads holding or waiting for it]; an entry is dropped once no thread
+# needs it, so the table doesn't grow with every store (e.g. user partition) ever used
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+
+# Serialises writers across threads (in-process lock) and across gunicorn workers
+# (advisory flock on a sidecar file, which survives the data file being replaced)
+@contextmanager
+def expense_file_lock(path):
+    with _process_locks_guard:
+        entry = _process_locks.setdefault(path, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            if fcntl is None:
+                yield
+                return
+            with open(path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    finally:
+        with _process_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _process_locks[path]
+
+
+# Calls `write(tmp_path)` and renames the result over `path`, so readers and a crash
+# at any point see either the complete old file or the complete new one
+def atomic_replace(path, write):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.expenses-', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        with open(tmp_path, 'rb+') as tmp_file:
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class ExpenseStore:
+    """Interface shared by the storage backends.
+
+    Backends must implement `load`, `append`, `replace` and `version`. The query and
+    aggregate methods below work on the loaded table; backends with indexes or
+    columnar files override them to filter and aggregate before rows reach pandas.
+    All filter keyword arguments are optional: `start_date`/`end_date` (Timestamps,
+    inclusive), `categories` (list), `min_amount`/`max_amount`.
+    """
+
+    name = None
+
+    # Returns the whole typed table; treat it as read-only
+    def load(self):
+        raise NotImplementedError
+
+    # Adds typed rows without rewriting existing data. Returns the store versions
+    # (before, after) around the write, taken while holding the write lock, so callers
+    # can tell whether anything else changed the store in between
+    def append(self, df):
+        raise NotImplementedError
+
+    # Replaces the whole data set with the typed rows in `df`
+    def replace(self, df):
+        raise NotImplementedError
+
+    # Opaque value that changes whenever the stored data changes
+    def version(self):
+        raise NotImplementedError
+
+    # Housekeeping after writes. Rewrites the stored files without changing the rows they
+    # hold; returns the (before, after) versions when it did (see ExpenseState.append),
+    # None otherwise.
+    def compact(self, force=False):
+        return None
+
+    # Held by an import across its duplicate check and append (see ExpenseState.append_new),
+    # so two imports into the same data - from other threads, other workers, or another
+    # ExpenseState over the same store - never both find a row new. A lock of its own,
+    # separate from the one append() takes
+    def import_lock(self):
+        return expense_file_lock(self.path + '.import')
+
+    def stats(self):
+        return {'backend': self.name}
+
+    def query(self, **filters):
+        return filter_expenses(self.load(), **filters)
+
+    # Returns up to `limit` matching rows ordered by (`sort`, id), ascending or
+    # descending, starting after the keyset cursor `after` = (sort value, id)
+    def page(self, sort='date', descending=False, after=None, limit=None, **filters):
+        df = self.query(**filters).sort_values([sort, 'id'], ascending=not descending, kind='stable')
+        return keyset_slice(df, sort, descending, after, limit)
+
+    # Returns {'total': float, 'count': int}
+    def summary(self, **filters):
+        df = self.query(**filters)
+        return {'total': float(df['amount'].sum()), 'count': len(df)}
+
+    # Returns {category: total}
+    def totals_by_category(self, **filters):
+        df = self.query(**filters)
+        return {str(k): float(v) for k, v in df.groupby('category')['amount'].sum().items()}
+
+    # Returns {'YYYY-MM': total} in chronological order
+    def totals_by_month(self, **filters):
+        df = self.query(**filters)
+        if df.empty:
+            return {}
+        monthly = df.groupby(df['date'].dt.to_period('M'))['amount'].sum().sort_index()
+        return dict(zip(monthly.index.strftime('%Y-%m'), monthly.astype(float)))
+
+    # Returns {(category, 'YYYY-MM'): total}
+    def totals_by_category_month(self, **filters):
+        df = self.query(**filters)
+        if df.empty:
+            return {}
+        totals = df.groupby([df['category'], iso_months(df['date'])])['amount'].sum()
+        return {(str(category), month): float(total) for (category, month), total in totals.items()}
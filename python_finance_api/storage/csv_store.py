@@ -0,0 +1,326 @@
+import io
+import os
+import threading
+import weakref
+
+import pandas as pd
+
+from .base import (EXPENSE_COLUMNS, ExpenseStore, atomic_replace, empty_expenses_frame,
+                   expense_file_lock, filter_mask, iso_dates, keyset_mask, parse_expenses,
+                   single_line_text)
+
+
+# Helper function to render typed rows the way they are stored on disk: one line per
+# expense (see _complete_records_end)
+def format_expenses_csv(df, header=True):
+    csv_df = single_line_text(df[EXPENSE_COLUMNS]).assign(date=iso_dates(df['date']))
+    return csv_df.to_csv(index=False, header=header, lineterminator='\n')
+
+
+# Identifies one exact state of the file: replaced files get a new inode,
+# edited or appended files a new size and/or modification time
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+# --- Writing ---
+
+# Writes `df` to `path` through a temp file and rename, so a crash never leaves a
+# half-written expense file behind
+def atomic_write_expenses_csv(path, df):
+    def write(tmp_path):
+        with open(tmp_path, 'w', newline='') as tmp_file:
+            tmp_file.write(format_expenses_csv(df))
+    atomic_replace(path, write)
+
+
+# Appends typed rows to the end of the file in a single write. Cost depends only on
+# the number of new rows, never on the size of the existing file. Caller holds the lock.
+def append_expenses_csv(path, df):
+    with open(path, 'ab+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            payload = format_expenses_csv(df)
+        else:
+            payload = format_expenses_csv(df, header=False)
+            # A writer that crashed mid-append can leave a partial last line; start
+            # on a fresh line so the new rows stay intact (compaction drops the junk)
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                payload = '\n' + payload
+        f.write(payload.encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# Ends the file with a newline if its last line has none (a hand edit, or a writer that
+# crashed mid-append). Readers stop at the last newline, so until then that line isn't
+# part of the data anyone has seen. A last record with an unclosed quote is torn and is
+# cut off instead: terminated, its open quote would swallow the rows appended after it.
+# Caller holds the lock.
+def terminate_last_line(path):
+    try:
+        with open(path, 'rb+') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b'\n':
+                return
+            # Rare (a crash or a hand edit), so the whole file is scanned for the quoting
+            f.seek(0)
+            data = f.read()
+            end = _complete_records_end(data)
+            if data.count(b'"', end) % 2:
+                f.truncate(end)
+            else:
+                f.write(b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        pass
+
+
+# --- Reading ---
+
+# Reads the file up to the end of its last complete record, so a reader racing an
+# appender never parses half a row. `start` must be at a record boundary. Returns the
+# bytes and the offset where the next read should start.
+def _read_complete_lines(path, start=0, end=None):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(-1 if end is None else end - start)
+    end = _complete_records_end(data)
+    return data[:end], start + end
+
+
+# Length of the complete records at the start of `data`: up to its last newline outside
+# a quoted field. Rows written by the app are one line each, but older files can hold
+# descriptions with line breaks, and a torn write can stop inside any quoted field.
+def _complete_records_end(data):
+    end = data.rfind(b'\n') + 1
+    quotes = data.count(b'"', 0, end)
+    while quotes % 2 and end:
+        previous = data.rfind(b'\n', 0, end - 1) + 1
+        quotes -= data.count(b'"', previous, end)
+        end = previous
+    return end
+
+
+# Parses raw CSV bytes; returns the typed rows and how many rows had to be dropped
+def _parse_csv_bytes(data, header=True):
+    if header:
+        raw = pd.read_csv(io.BytesIO(data))
+    else:
+        raw = pd.read_csv(io.BytesIO(data), header=None, names=EXPENSE_COLUMNS)
+    typed = parse_expenses(raw)
+    return typed, len(raw) - len(typed)
+
+
+class ExpenseCache:
+    """Keeps the parsed, typed expense table in memory between requests.
+
+    The table is re-read only when the file's signature changes. When the file has
+    only grown (appends from this or another worker), just the new tail is parsed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._frame = None
+        self._signature = None
+        self._offset = 0  # Bytes of the file reflected in _frame
+        self._last_line = b''  # Used to check the already-parsed prefix is unchanged
+        self.hits = 0
+        self.misses = 0
+        self.tail_reads = 0
+        self.invalid_rows = 0  # Rows dropped as unparseable since the last full load
+
+    # Returns a shallow copy of the cached table: no column data is copied, and with
+    # Copy-on-Write any modification made by the caller stays local to the caller
+    def get(self):
+        return self.get_keyed()[0]
+
+    # Like get(), but also returns a key for whatever the caller derives from the table
+    # (see CsvExpenseStore.page): the cached table itself, the same object for as long
+    # as the data is unchanged
+    def get_keyed(self):
+        signature = file_signature(self.path)
+        with self._lock:
+            if self._frame is not None and signature is not None and signature == self._signature:
+                self.hits += 1
+                return self._frame.copy(deep=False), self._frame
+            self.misses += 1
+            if not (self._frame is not None and self._can_read_tail(signature) and self._read_tail(signature)):
+                if not self._read_full(signature):
+                    # Served, but not cached: the next lookup reads the file again
+                    self._signature = None
+                    return self._frame.copy(deep=False), self._frame
+            # Keep the signature taken before the read: bytes appended while parsing
+            # are picked up by the next lookup's tail read
+            self._signature = signature or file_signature(self.path)
+            return self._frame.copy(deep=False), self._frame
+
+    def _can_read_tail(self, signature):
+        if signature is None or self._signature is None:
+            return False
+        same_file = signature[0] == self._signature[0]
+        return same_file and 0 < self._offset < signature[1]
+
+    def _read_tail(self, signature):
+        # The file must still hold the exact line we parsed last; anything else means
+        # it was edited in place and the tail offset is meaningless
+        start = self._offset - len(self._last_line)
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            if f.read(len(self._last_line)) != self._last_line:
+                return False
+        data, offset = _read_complete_lines(self.path, self._offset, signature[1])
+        if data:
+            try:
+                tail, dropped = _parse_csv_bytes(data, header=False)
+            except ValueError:  # pandas' ParserError included; a full read sorts it out
+                return False
+            if self._frame.empty:
+                self._frame = tail
+            elif len(tail):
+                self._frame = pd.concat([self._frame, tail], ignore_index=True)
+            self.invalid_rows += dropped
+            self._remember_offset(data, offset)
+        self.tail_reads += 1
+        return True
+
+    # Returns False if the file couldn't be parsed; the table is then left as it was
+    # (empty if there was none)
+    def _read_full(self, signature):
+        self.invalid_rows = 0
+        if not os.path.exists(self.path):
+            empty_expenses_frame().to_csv(self.path, index=False)
+        try:
+            # Stop at the size that was stat'ed, so the offset matches the signature
+            data, offset = _read_complete_lines(self.path, 0, signature and signature[1])
+            self._frame, self.invalid_rows = _parse_csv_bytes(data)
+            self._remember_offset(data, offset)
+        except pd.errors.EmptyDataError:
+            self._frame = empty_expenses_frame()
+            self._offset, self._last_line = 0, b''
+        except Exception as e:
+            print(f"Error loading CSV: {e}")
+            # Keep serving the last good table (or an empty one) to prevent an app crash
+            if self._frame is None:
+                self._frame = empty_expenses_frame()
+            self._offset, self._last_line = 0, b''
+            return False
+        return True
+
+    def _remember_offset(self, data, offset):
+        self._offset = offset
+        previous_newline = data.rfind(b'\n', 0, len(data) - 1)
+        self._last_line = data[previous_newline + 1:]
+
+    # Called right after the app rewrote the file with `df`, so the next read is a
+    # hit instead of parsing back what was just written
+    def update(self, df):
+        with self._lock:
+            self._frame = df.copy(deep=False)
+            self._signature = file_signature(self.path)
+            # Only the last line is needed to validate future tail reads; the file was
+            # just written whole, so it ends on a record boundary
+            start = max(0, self._signature[1] - 4096)
+            with open(self.path, 'rb') as f:
+                f.seek(start)
+                data = f.read()
+            self._remember_offset(data, start + len(data))
+            self.invalid_rows = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._frame = None
+            self._signature = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'tail_reads': self.tail_reads,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'cached_rows': 0 if self._frame is None else len(self._frame),
+                'invalid_rows': self.invalid_rows,
+            }
+
+
+class CsvExpenseStore(ExpenseStore):
+    """The original flat expenses.csv, read through the in-memory cache."""
+
+    name = 'csv'
+
+    # Rewrite the file once the cache has seen this many unparseable rows in it
+    compact_after_invalid_rows = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.cache = ExpenseCache(path)
+        self._orders = {}  # sort column -> (weak ref to the cache's key, row positions ordered by (column, id))
+
+    def load(self):
+        return self.cache.get()
+
+    def append(self, df):
+        with expense_file_lock(self.path):
+            # Done first, so `before` is a version whose data includes that line: otherwise
+            # it would only appear along with our rows and be missed by incremental totals
+            terminate_last_line(self.path)
+            before = file_signature(self.path)
+            append_expenses_csv(self.path, df)
+            return before, file_signature(self.path)
+
+    def replace(self, df):
+        with expense_file_lock(self.path):
+            atomic_write_expenses_csv(self.path, df)
+            self.cache.update(df)
+
+    def version(self):
+        return file_signature(self.path)
+
+    # Torn or hand-edited rows are dropped on read; rewrite the file once they show up.
+    # Appends never need this.
+    def compact(self, force=False):
+        if not force and self.cache.invalid_rows < self.compact_after_invalid_rows:
+            return None
+        with expense_file_lock(self.path):
+            df = self.cache.get()
+            before = self.version()
+            atomic_write_expenses_csv(self.path, df)
+            self.cache.update(df)
+            return before, self.version()
+
+    # Pages are cut from the cached table through its sort order, kept until the data
+    # changes, so paging through a listing doesn't re-sort everything on every request.
+    # Only the row positions are kept, not a sorted copy: a copy would double the memory
+    # held per worker, and the table preloaded by the master stays shared with it.
+    def page(self, sort='date', descending=False, after=None, limit=None, **filters):
+        df, key = self.cache.get_keyed()
+        order = self._sort_order(df, key, sort)
+        mask = filter_mask(df, **filters)
+        if after is not None:
+            mask &= keyset_mask(df, sort, descending, after)
+        if descending:
+            order = order[::-1]
+        rows = order[mask.to_numpy()[order]]
+        return df.take(rows if limit is None else rows[:limit])
+
+    def _sort_order(self, df, key, sort):
+        cached = self._orders.get(sort)
+        if cached is None or cached[0]() is not key:
+            keys = df[[sort, 'id']].reset_index(drop=True)
+            order = keys.sort_values([sort, 'id'], kind='stable').index.to_numpy()
+            self._orders[sort] = cached = (weakref.ref(key), order)
+        return cached[1]
+
+    def stats(self):
+        return {'backend': self.name, 'cache': self.cache.stats()}
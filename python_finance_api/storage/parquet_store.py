@@ -0,0 +1,181 @@
+import os
+import re
+import uuid
+
+from .base import EXPENSE_COLUMNS, ExpenseStore, empty_expenses_frame, expense_file_lock, parse_expenses
+
+# pyarrow is only needed when this backend is selected
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the deployment
+    pa = None
+
+_FILE_PATTERN = re.compile(r'^(base|part)-(\d+)(?:-[0-9a-f]+)?\.parquet$')
+
+
+def _schema():
+    return pa.schema([
+        ('id', pa.string()),
+        ('date', pa.timestamp('ms')),
+        ('category', pa.string()),
+        ('amount', pa.float64()),
+        ('description', pa.string()),
+    ])
+
+
+class ParquetExpenseStore(ExpenseStore):
+    """Expenses as a directory of immutable Parquet files.
+
+    Layout: `base-<gen>.parquet` holds everything up to the last compaction and each
+    append adds a small `part-<gen>-<uuid>.parquet`. Readers use the highest base
+    generation plus that generation's parts, so compaction (writing `base-<gen+1>`
+    through a rename) is atomic and older files are simply ignored. The generation
+    just superseded is kept until the next compaction, so readers still scanning it
+    (in other threads or workers) can finish; a reader that loses the race anyway
+    lists the files again and retries.
+    Filters are pushed down to the Parquet row-group statistics.
+    """
+
+    name = 'parquet'
+
+    # Merge the parts into a new base once there are this many of them
+    max_parts = 32
+
+    def __init__(self, path):
+        if pa is None:
+            raise RuntimeError("The parquet storage backend requires pyarrow (pip install pyarrow)")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _lock(self):
+        return expense_file_lock(os.path.join(self.path, 'store'))
+
+    def import_lock(self):
+        return expense_file_lock(os.path.join(self.path, 'import'))
+
+    # Returns (generation, base file or None, sorted part files) for the live data set
+    def _files(self):
+        bases, parts = {}, {}
+        for name in os.listdir(self.path):
+            match = _FILE_PATTERN.match(name)
+            if match:
+                kind, generation = match.group(1), int(match.group(2))
+                target = bases if kind == 'base' else parts
+                target.setdefault(generation, []).append(name)
+        generation = max(bases) if bases else 0
+        base = bases[generation][0] if bases else None
+        return generation, base, sorted(parts.get(generation, []))
+
+    def _dataset(self):
+        _, base, parts = self._files()
+        files = ([base] if base else []) + parts
+        return ds.dataset([os.path.join(self.path, f) for f in files], schema=_schema(), format='parquet')
+
+    def _table(self, start_date=None, end_date=None, categories=None, min_amount=None, max_amount=None,
+               columns=None):
+        conditions = []
+        if start_date is not None:
+            conditions.append(ds.field('date') >= pa.scalar(start_date.to_pydatetime(), pa.timestamp('ms')))
+        if end_date is not None:
+            conditions.append(ds.field('date') <= pa.scalar(end_date.to_pydatetime(), pa.timestamp('ms')))
+        if categories:
+            conditions.append(ds.field('category').isin(list(categories)))
+        if min_amount is not None:
+            conditions.append(ds.field('amount') >= float(min_amount))
+        if max_amount is not None:
+            conditions.append(ds.field('amount') <= float(max_amount))
+        condition = None
+        for c in conditions:
+            condition = c if condition is None else condition & c
+        try:
+            return self._dataset().to_table(columns=columns, filter=condition)
+        except FileNotFoundError:
+            # Our file list is from before a compaction that has since removed it
+            return self._dataset().to_table(columns=columns, filter=condition)
+
+    def _write_file(self, name, df):
+        self._write_table(name, pa.Table.from_pandas(df[EXPENSE_COLUMNS], schema=_schema(), preserve_index=False))
+
+    # Files appear under their final name only once complete
+    def _write_table(self, name, table):
+        tmp_path = os.path.join(self.path, '.' + name + '.tmp')
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def load(self):
+        return self.query()
+
+    def append(self, df):
+        with self._lock():
+            before = self.version()
+            self._write_file(f'part-{before[0]}-{uuid.uuid4().hex}.parquet', df)
+            return before, self.version()
+
+    def replace(self, df):
+        with self._lock():
+            generation, _, _ = self._files()
+            self._write_file(f'base-{generation + 1}.parquet', df)
+            self._remove_stale(generation + 1)
+
+    # Files are immutable and uniquely named, so their names identify the data set
+    def version(self):
+        generation, base, parts = self._files()
+        return (generation, base, tuple(parts))
+
+    def compact(self, force=False):
+        with self._lock():
+            generation, _, parts = self._files()
+            if not parts or (not force and len(parts) < self.max_parts):
+                return None
+            before = self.version()
+            self._write_table(f'base-{generation + 1}.parquet', self._table())
+            self._remove_stale(generation + 1)
+            return before, self.version()
+
+    # Removes the files of generations before the one `generation` supersedes
+    def _remove_stale(self, generation):
+        for name in os.listdir(self.path):
+            match = _FILE_PATTERN.match(name)
+            if match and int(match.group(2)) < generation - 1:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        generation, base, parts = self._files()
+        return {'backend': self.name, 'generation': generation, 'parts': len(parts)}
+
+    def query(self, **filters):
+        table = self._table(**filters)
+        if table.num_rows == 0:
+            return parse_expenses(empty_expenses_frame())
+        return parse_expenses(table.to_pandas())
+
+    def summary(self, **filters):
+        amounts = self._table(columns=['amount'], **filters)['amount']
+        total = pc.sum(amounts).as_py()
+        return {'total': float(total or 0), 'count': len(amounts)}
+
+    def totals_by_category(self, **filters):
+        table = self._table(columns=['category', 'amount'], **filters)
+        grouped = table.group_by('category').aggregate([('amount', 'sum')]).sort_by('category')
+        return dict(zip(grouped['category'].to_pylist(), map(float, grouped['amount_sum'].to_pylist())))
+
+    def totals_by_month(self, **filters):
+        table = self._table(columns=['date', 'amount'], **filters)
+        months = pc.strftime(table['date'], format='%Y-%m')
+        grouped = (pa.table({'month': months, 'amount': table['amount']})
+                   .group_by('month').aggregate([('amount', 'sum')]).sort_by('month'))
+        return dict(zip(grouped['month'].to_pylist(), map(float, grouped['amount_sum'].to_pylist())))
+
+    def totals_by_category_month(self, **filters):
+        table = self._table(columns=['category', 'date', 'amount'], **filters)
+        months = pc.strftime(table['date'], format='%Y-%m')
+        grouped = (pa.table({'category': table['category'], 'month': months, 'amount': table['amount']})
+                   .group_by(['category', 'month']).aggregate([('amount', 'sum')]))
+        return {(category, month): float(total) for category, month, total in zip(
+            grouped['category'].to_pylist(), grouped['month'].to_pylist(), grouped['amount_sum'].to_pylist())}
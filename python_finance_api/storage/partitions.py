@@ -0,0 +1,85 @@
+import hashlib
+import os
+import re
+
+# Characters allowed in a user id; ids become file names
+USER_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# File (or, for parquet, directory) name of a user's partition: <user id><suffix>
+PARTITION_SUFFIXES = {
+    'csv': '.csv',
+    'sqlite': '.sqlite3',
+    'parquet': '_parquet',
+}
+
+
+# Helper function to check a user id before it is used in a path (raises ValueError)
+def validate_user_id(user_id):
+    user_id = str(user_id)
+    if not USER_ID_PATTERN.match(user_id):
+        raise ValueError(f'Invalid user id {user_id!r}')
+    return user_id
+
+
+class UserPartitions:
+    """One expense store per user, all of the same backend, under `root`.
+
+    Flat layout: <root>/<user id>.csv. With `sharded`, partitions are spread over
+    two levels of hash-named directories, <root>/3f/a2/<user id>.csv (from the SHA-1
+    of the id), so no directory grows past a few hundred entries however many
+    users there are.
+    """
+
+    def __init__(self, root, backend='csv', sharded=False):
+        if backend not in PARTITION_SUFFIXES:
+            raise ValueError(f"Unknown storage backend '{backend}'. Expected one of {tuple(PARTITION_SUFFIXES)}")
+        self.root = root
+        self.backend = backend
+        self.sharded = sharded
+        self.suffix = PARTITION_SUFFIXES[backend]
+
+    def path(self, user_id):
+        user_id = validate_user_id(user_id)
+        name = user_id + self.suffix
+        if self.sharded:
+            digest = hashlib.sha1(user_id.encode()).hexdigest()
+            return os.path.join(self.root, digest[:2], digest[2:4], name)
+        return os.path.join(self.root, name)
+
+    # Opens (creating the directories for) a user's store; an empty one if the user
+    # has no expenses yet
+    def open(self, user_id):
+        from . import open_store
+        path = self.path(user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open_store(self.backend, path)
+
+    # Yields the ids of the users that have a partition
+    def user_ids(self):
+        if not os.path.isdir(self.root):
+            return
+        directories = [self.root]
+        if self.sharded:
+            directories = [os.path.join(self.root, a, b)
+                           for a in sorted(os.listdir(self.root)) if os.path.isdir(os.path.join(self.root, a))
+                           for b in sorted(os.listdir(os.path.join(self.root, a)))]
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                user_id = name[:-len(self.suffix)]
+                if name.endswith(self.suffix) and USER_ID_PATTERN.match(user_id):
+                    yield user_id
+
+
+# Splits the expenses of one shared store into per-user partitions. `owners` gives the
+# user id of every row of `df` (aligned on its index). Each user's partition is
+# replaced with that user's rows. Returns {user id: number of expenses}.
+def split_expenses(df, owners, partitions):
+    owners = owners.astype(str)
+    for user_id in owners.unique():
+        validate_user_id(user_id)  # Check every id before anything is written
+    counts = {}
+    for user_id, rows in df.groupby(owners, sort=True):
+        partitions.open(user_id).replace(rows.reset_index(drop=True))
+        counts[user_id] = len(rows)
+    return counts
@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from .base import EXPENSE_COLUMNS, SORT_COLUMNS, ExpenseStore, iso_dates, parse_expenses
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,          -- 'YYYY-MM-DD', so string order is date order
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date);
+CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses (category, date);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO store_meta (key, value) VALUES ('version', 0);
+"""
+
+
+# Builds the WHERE conditions for the shared filter keywords; the date and category
+# conditions can use the indexes
+def _conditions(start_date=None, end_date=None, categories=None, min_amount=None, max_amount=None):
+    clauses, params = [], []
+    if start_date is not None:
+        clauses.append('date >= ?')
+        params.append(start_date.strftime('%Y-%m-%d'))
+    if end_date is not None:
+        clauses.append('date <= ?')
+        params.append(end_date.strftime('%Y-%m-%d'))
+    if categories:
+        clauses.append(f"category IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    if min_amount is not None:
+        clauses.append('amount >= ?')
+        params.append(float(min_amount))
+    if max_amount is not None:
+        clauses.append('amount <= ?')
+        params.append(float(max_amount))
+    return clauses, params
+
+
+def _where(**filters):
+    clauses, params = _conditions(**filters)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def _rows(df):
+    return zip(df['id'].astype(str), iso_dates(df['date']), df['category'].astype(str),
+               df['amount'].astype(float), df['description'].astype(str))
+
+
+class SqliteExpenseStore(ExpenseStore):
+    """Expenses in a SQLite database with indexes on date and category.
+
+    Filters and aggregates run as SQL, so only matching rows (or just the totals)
+    are handed back to Python.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    # sqlite3 connections must not cross threads or a fork, so each thread of each
+    # worker process opens its own
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # Returns the versions before and after the write
+    def _write(self, df, replace=False):
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.execute("SELECT value FROM store_meta WHERE key = 'version'").fetchone()[0]
+            if replace:
+                conn.execute('DELETE FROM expenses')
+            # Appends must not silently overwrite an existing row (it would already be
+            # counted in the running totals); a full replace keeps the last duplicate id
+            verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+            conn.executemany(
+                f'{verb} INTO expenses (id, date, category, amount, description) VALUES (?, ?, ?, ?, ?)',
+                _rows(df))
+            conn.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'version'")
+        return before, before + 1
+
+    def load(self):
+        return self.query()
+
+    def append(self, df):
+        return self._write(df)
+
+    def replace(self, df):
+        self._write(df, replace=True)
+
+    def version(self):
+        return self._connect().execute(
+            "SELECT value FROM store_meta WHERE key = 'version'").fetchone()[0]
+
+    def stats(self):
+        return {'backend': self.name, 'version': self.version()}
+
+    def query(self, **filters):
+        where, params = _where(**filters)
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(EXPENSE_COLUMNS)} FROM expenses{where} ORDER BY date, rowid",
+            self._connect(), params=params)
+        return parse_expenses(df)
+
+    # Keyset pagination in SQL: the cursor becomes a row-value comparison and LIMIT
+    # stops the scan once the page is full
+    def page(self, sort='date', descending=False, after=None, limit=None, **filters):
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by '{sort}'")
+        clauses, params = _conditions(**filters)
+        if after is not None:
+            value, last_id = after
+            clauses.append(f"({sort}, id) {'<' if descending else '>'} (?, ?)")
+            params.extend([value.strftime('%Y-%m-%d') if sort == 'date' else float(value), str(last_id)])
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        direction = 'DESC' if descending else 'ASC'
+        sql = f"SELECT {', '.join(EXPENSE_COLUMNS)} FROM expenses{where} ORDER BY {sort} {direction}, id {direction}"
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return parse_expenses(pd.read_sql_query(sql, self._connect(), params=params))
+
+    def summary(self, **filters):
+        where, params = _where(**filters)
+        total, count = self._connect().execute(
+            f'SELECT COALESCE(SUM(amount), 0), COUNT(*) FROM expenses{where}', params).fetchone()
+        return {'total': float(total), 'count': int(count)}
+
+    def totals_by_category(self, **filters):
+        where, params = _where(**filters)
+        rows = self._connect().execute(
+            f'SELECT category, SUM(amount) FROM expenses{where} GROUP BY category ORDER BY category',
+            params)
+        return {category: float(total) for category, total in rows}
+
+    def totals_by_month(self, **filters):
+        where, params = _where(**filters)
+        rows = self._connect().execute(
+            f'SELECT substr(date, 1, 7) AS month, SUM(amount) FROM expenses{where} '
+            'GROUP BY month ORDER BY month', params)
+        return {month: float(total) for month, total in rows}
+
+    def totals_by_category_month(self, **filters):
+        where, params = _where(**filters)
+        rows = self._connect().execute(
+            f'SELECT category, substr(date, 1, 7) AS month, SUM(amount) FROM expenses{where} '
+            'GROUP BY category, month', params)
+        return {(category, month): float(total) for category, month, total in rows}
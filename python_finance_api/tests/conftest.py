@@ -0,0 +1,42 @@
+# Tests for the finance API. Run from python_finance_api/:
+#   pip install -r requirements-dev.txt
+#   python -m pytest tests
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The API's modules import each other by their top-level names (app, storage, state, ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+HEADER = 'id,date,category,amount,description\n'
+
+
+# Builds typed expense rows from (id, date, category, amount, description) tuples
+def expenses(*rows):
+    return pd.DataFrame({
+        'id': [r[0] for r in rows],
+        'date': pd.to_datetime([r[1] for r in rows]),
+        'category': [r[2] for r in rows],
+        'amount': [float(r[3]) for r in rows],
+        'description': [r[4] for r in rows],
+    })
+
+
+@pytest.fixture
+def make_expenses():
+    return expenses
+
+
+# Returns a function creating an app over a fresh store in the test's temp directory
+@pytest.fixture
+def make_app(tmp_path):
+    from app import create_app
+    from storage import DEFAULT_PATHS
+
+    def make_app(backend='csv', **config):
+        return create_app({'STORAGE_BACKEND': backend, 'STORAGE_PATH': str(tmp_path / DEFAULT_PATHS[backend]),
+                           'PRELOAD_DATA': False, 'IMPORT_JOBS_DIR': str(tmp_path / 'import_jobs'),
+                           'METRICS_DIR': None, 'PARTITIONS_DIR': str(tmp_path / 'users'), **config})
+    return make_app
@@ -0,0 +1,76 @@
+import pytest
+
+from aggregates import ExpenseAggregates
+from storage import BACKENDS, DEFAULT_PATHS, open_store
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path, make_expenses):
+    store = open_store(request.param, str(tmp_path / DEFAULT_PATHS[request.param]))
+    store.replace(make_expenses(
+        ('a', '2025-01-05', 'Food', 10.0, 'x'),
+        ('b', '2025-01-20', 'Rent', 500.0, 'y'),
+        ('c', '2025-02-01', 'Food', 5.5, 'z'),
+    ))
+    return store
+
+
+def test_snapshot_builds_the_totals(store):
+    snapshot = ExpenseAggregates().snapshot(store)
+    assert snapshot == {'total': 515.5, 'count': 3,
+                        'by_category': {'Food': 15.5, 'Rent': 500.0},
+                        'by_month': {'2025-01': 510.0, '2025-02': 5.5}}
+
+
+def test_apply_patches_the_totals_without_a_rebuild(store, make_expenses):
+    aggregates = ExpenseAggregates()
+    aggregates.snapshot(store)
+    new = make_expenses(('d', '2025-03-01', 'Travel', 100.0, 'w'), ('e', '2025-01-31', 'Food', 4.5, 'v'))
+    before, after = store.append(new)
+    aggregates.apply(new, before, after)
+    snapshot = aggregates.snapshot(store)
+    assert aggregates.rebuilds == 1
+    assert snapshot['count'] == 5
+    assert snapshot['by_category'] == {'Food': 20.0, 'Rent': 500.0, 'Travel': 100.0}
+    assert snapshot['by_month'] == {'2025-01': 514.5, '2025-02': 5.5, '2025-03': 100.0}
+    assert aggregates.category_month_totals(store)[1][('Food', '2025-01')] == 14.5
+
+
+def test_write_made_elsewhere_triggers_a_rebuild(store, make_expenses):
+    aggregates = ExpenseAggregates()
+    aggregates.snapshot(store)
+    other = open_store(store.name, store.path)  # e.g. another worker
+    other.append(make_expenses(('d', '2025-03-01', 'Travel', 100.0, 'w')))
+    snapshot = aggregates.snapshot(store)
+    assert aggregates.rebuilds == 2
+    assert (snapshot['count'], snapshot['total']) == (4, 615.5)
+
+
+def test_apply_at_a_stale_version_defers_to_a_rebuild(store, make_expenses):
+    aggregates = ExpenseAggregates()
+    aggregates.snapshot(store)
+    other = open_store(store.name, store.path)
+    other.append(make_expenses(('d', '2025-03-01', 'Travel', 100.0, 'w')))
+    mine = make_expenses(('e', '2025-03-02', 'Food', 1.0, 'v'))
+    before, after = store.append(mine)
+    aggregates.apply(mine, before, after)  # Totals were at the version before `other`'s write
+    assert not aggregates.stats()['built']
+    snapshot = aggregates.snapshot(store)
+    assert (snapshot['count'], snapshot['total']) == (5, 616.5)
+
+
+def test_compaction_after_an_append_needs_no_rebuild(store, make_expenses):
+    from state import ExpenseState
+    if store.name == 'parquet':
+        store.max_parts = 1
+    elif store.name == 'csv':
+        with open(store.path, 'a') as f:
+            f.write('torn,row\n')  # Dropped on read, then compacted away by the next append
+    state = ExpenseState(store)
+    state.warm()
+    state.append_new(make_expenses(('d', '2025-03-01', 'Travel', 100.0, 'w')), {})
+    assert store.compact() is None  # Nothing left to compact
+    state.append_new(make_expenses(('e', '2025-03-02', 'Food', 1.0, 'v')), {})
+    snapshot = state.aggregates.snapshot(store)
+    assert (snapshot['count'], snapshot['total']) == (5, 616.5)
+    assert (state.aggregates.rebuilds, state.duplicates.rebuilds) == (1, 1)
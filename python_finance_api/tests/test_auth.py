@@ -0,0 +1,63 @@
+import base64
+import json
+
+import pytest
+
+from auth import AuthError, _signature, sign_user_token, user_from_authorization, verify_user_token
+
+SECRET = 'test-secret'
+
+
+def signed(claims):
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip('=')
+    return f'{payload}.{_signature(payload, SECRET)}'
+
+
+def test_round_trip():
+    assert verify_user_token(sign_user_token(42, SECRET), SECRET) == '42'
+    assert user_from_authorization(f'Bearer {sign_user_token("u1", SECRET)}', SECRET) == 'u1'
+
+
+@pytest.mark.parametrize('token', [
+    '',
+    'no-dot',
+    '.signature-only',
+    'payload.',
+    'x.é',  # Non-ASCII signature
+    'é.x',
+    signed({'sub': 'u1', 'exp': 'tomorrow'}),
+    signed({'exp': 9999999999}),
+    signed(['u1']),
+])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(AuthError):
+        verify_user_token(token, SECRET)
+
+
+def test_unparseable_but_correctly_signed_payload_is_rejected():
+    payload = base64.urlsafe_b64encode(b'{not json').decode().rstrip('=')
+    with pytest.raises(AuthError):
+        verify_user_token(f'{payload}.{_signature(payload, SECRET)}', SECRET)
+
+
+def test_token_signed_with_another_secret_is_rejected():
+    with pytest.raises(AuthError, match='Invalid token'):
+        verify_user_token(sign_user_token('u1', 'other-secret'), SECRET)
+
+
+def test_tampered_payload_is_rejected():
+    payload, signature = sign_user_token('u1', SECRET).split('.')
+    forged = base64.urlsafe_b64encode(json.dumps({'sub': 'u2', 'exp': 9999999999}).encode()).decode().rstrip('=')
+    with pytest.raises(AuthError):
+        verify_user_token(f'{forged}.{signature}', SECRET)
+
+
+def test_expired_token_is_rejected():
+    with pytest.raises(AuthError, match='expired'):
+        verify_user_token(sign_user_token('u1', SECRET, ttl=-1), SECRET)
+
+
+@pytest.mark.parametrize('header', [None, '', 'Bearer', 'Bearer   ', f'Basic {sign_user_token("u1", SECRET)}'])
+def test_missing_bearer_token_is_rejected(header):
+    with pytest.raises(AuthError, match='Missing'):
+        user_from_authorization(header, SECRET)
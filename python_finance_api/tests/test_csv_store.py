@@ -0,0 +1,140 @@
+from conftest import HEADER
+
+from state import ExpenseState
+from storage import CsvExpenseStore, ExpenseCache
+
+
+def write(path, text, mode='w'):
+    with open(path, mode, newline='') as f:
+        f.write(text)
+
+
+def test_unchanged_file_is_a_cache_hit(tmp_path):
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\n')
+    cache = ExpenseCache(str(path))
+    assert list(cache.get()['id']) == ['a']
+    assert list(cache.get()['id']) == ['a']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_appended_rows_are_read_from_the_tail(tmp_path):
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\n')
+    cache = ExpenseCache(str(path))
+    cache.get()
+    write(path, 'b,2025-01-02,Food,2.0,y\nc,2025-01-03,Rent,3.0,z\n', 'a')
+    df = cache.get()
+    assert list(df['id']) == ['a', 'b', 'c']
+    assert cache.tail_reads == 1
+    assert df['date'].dt.day.tolist() == [1, 2, 3]
+
+
+def test_torn_last_line_is_read_once_complete(tmp_path):
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\nb,2025-01-02,Fo')
+    cache = ExpenseCache(str(path))
+    assert list(cache.get()['id']) == ['a']
+    write(path, 'od,2.0,y\n', 'a')
+    df = cache.get()
+    assert list(df['id']) == ['a', 'b']
+    assert df.loc[1, 'category'] == 'Food'
+    assert cache.tail_reads == 1
+
+
+def test_file_edited_in_place_is_read_in_full(tmp_path):
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\n')
+    cache = ExpenseCache(str(path))
+    cache.get()
+    # Same prefix length, different content, then more rows: not a plain append
+    write(path, HEADER + 'a,2025-01-01,Food,9.0,x\nb,2025-01-02,Food,2.0,y\n')
+    df = cache.get()
+    assert df['amount'].tolist() == [9.0, 2.0]
+    assert cache.tail_reads == 0
+
+
+def test_append_after_a_missing_trailing_newline_keeps_totals_in_step(tmp_path, make_expenses):
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\nb,2025-01-02,Food,2.0,y')
+    state = ExpenseState(CsvExpenseStore(str(path)))
+    assert state.aggregates.snapshot(state.store)['count'] == 1  # The unterminated row isn't visible yet
+    state.append(make_expenses(('c', '2025-01-03', 'Food', 3.0, 'z')))
+    assert list(state.store.load()['id']) == ['a', 'b', 'c']
+    snapshot = state.aggregates.snapshot(state.store)
+    assert (snapshot['count'], snapshot['total']) == (3, 6.0)
+
+
+def test_line_breaks_in_text_are_stored_on_one_line(tmp_path, make_expenses):
+    path = tmp_path / 'expenses.csv'
+    state = ExpenseState(CsvExpenseStore(str(path)))
+    state.append(make_expenses(('a', '2025-01-01', 'Food', 1.0, 'two\r\nlines')))
+    assert path.read_text().count('\n') == 2
+    assert state.store.load()['description'].tolist() == ['two lines']
+
+
+def test_quoted_record_caught_mid_write_is_read_once_complete(tmp_path):
+    path = tmp_path / 'expenses.csv'
+    # Older files can hold quoted descriptions with line breaks
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,"two\nlines"\nb,2025-01-02,Food,2.0,"half\nwritten')
+    cache = ExpenseCache(str(path))
+    df = cache.get()
+    assert list(df['id']) == ['a'] and df.loc[0, 'description'] == 'two\nlines'
+    write(path, ' record"\n', 'a')
+    df = cache.get()
+    assert list(df['id']) == ['a', 'b'] and df.loc[1, 'description'] == 'half\nwritten record'
+    assert cache.tail_reads == 1
+
+
+def test_append_cuts_off_a_torn_quoted_record(tmp_path, make_expenses):
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\nb,2025-01-02,Food,2.0,"torn, before\nthe end')
+    state = ExpenseState(CsvExpenseStore(str(path)))
+    state.append(make_expenses(('c', '2025-01-03', 'Food', 3.0, 'z')))
+    assert list(state.store.load()['id']) == ['a', 'c']
+    assert state.aggregates.snapshot(state.store)['count'] == 2
+
+
+def test_unparseable_tail_falls_back_to_a_full_read(tmp_path, monkeypatch):
+    import storage.csv_store as csv_store
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\n')
+    cache = ExpenseCache(str(path))
+    cache.get()
+    write(path, 'b,2025-01-02,Food,2.0,y\n', 'a')
+    parse = csv_store._parse_csv_bytes
+
+    def failing_tail(data, header=True):
+        if not header:
+            raise csv_store.pd.errors.ParserError('simulated')
+        return parse(data, header)
+    monkeypatch.setattr(csv_store, '_parse_csv_bytes', failing_tail)
+    assert list(cache.get()['id']) == ['a', 'b']
+    assert cache.tail_reads == 0
+
+
+def test_failed_full_read_is_not_cached(tmp_path, monkeypatch):
+    import storage.csv_store as csv_store
+    path = tmp_path / 'expenses.csv'
+    write(path, HEADER + 'a,2025-01-01,Food,1.0,x\n')
+    cache = ExpenseCache(str(path))
+    parse = csv_store._parse_csv_bytes
+    monkeypatch.setattr(csv_store, '_parse_csv_bytes', lambda *args, **kwargs: 1 / 0)
+    assert cache.get().empty
+    monkeypatch.setattr(csv_store, '_parse_csv_bytes', parse)
+    assert list(cache.get()['id']) == ['a']
+    assert cache.hits == 0
+
+
+def test_page_order_is_kept_until_the_data_changes(tmp_path, make_expenses):
+    store = CsvExpenseStore(str(tmp_path / 'expenses.csv'))
+    store.replace(make_expenses(('b', '2025-01-02', 'Food', 2.0, 'x'), ('a', '2025-01-02', 'Rent', 9.0, 'y'),
+                                ('c', '2025-01-01', 'Food', 5.0, 'z')))
+    assert list(store.page(sort='date')['id']) == ['c', 'a', 'b']
+    order = store._orders['date'][1]
+    assert list(store.page(sort='date', descending=True, categories=['Food'])['id']) == ['b', 'c']
+    assert store._orders['date'][1] is order  # Reused, not re-sorted
+
+    store.append(make_expenses(('d', '2024-12-31', 'Food', 1.0, 'w')))
+    assert list(store.page(sort='date', limit=2)['id']) == ['d', 'c']
+    assert list(store.page(sort='amount', descending=True, after=(5.0, 'c'))['id']) == ['b', 'd']
@@ -0,0 +1,85 @@
+from dedup import DuplicateIndex
+from storage import open_store
+
+COFFEE = ('a', '2025-01-01', 'Dining', 3.5, 'Coffee shop')
+
+
+def upload_rows(make_expenses, *rows):
+    # Uploaded rows get fresh ids; only date, amount and description identify a duplicate
+    return make_expenses(*[(f'new-{i}', *row[1:]) for i, row in enumerate(rows)])
+
+
+def add_new(index, store, df, seen):
+    df = df[index.new_rows(store, df, seen)]
+    before, after = store.append(df)
+    index.apply(df, before, after)
+    return len(df)
+
+
+def test_repeated_rows_in_one_upload_are_all_new(tmp_path, make_expenses):
+    store = open_store('csv', str(tmp_path / 'expenses.csv'))
+    store.load()  # Creates the file
+    index = DuplicateIndex()
+    statement = upload_rows(make_expenses, COFFEE, COFFEE)
+    assert add_new(index, store, statement, {}) == 2
+    assert add_new(index, store, statement, {}) == 0  # Importing it again adds neither
+    assert index.rebuilds == 1
+
+
+def test_only_the_occurrences_beyond_the_stored_count_are_new(tmp_path, make_expenses):
+    store = open_store('csv', str(tmp_path / 'expenses.csv'))
+    store.replace(make_expenses(COFFEE))
+    index = DuplicateIndex()
+    assert add_new(index, store, upload_rows(make_expenses, COFFEE, COFFEE, COFFEE), {}) == 2
+    assert len(store.load()) == 3
+
+
+def test_occurrences_are_counted_across_batches(tmp_path, make_expenses):
+    store = open_store('csv', str(tmp_path / 'expenses.csv'))
+    store.replace(make_expenses(COFFEE, COFFEE))
+    index = DuplicateIndex()
+    seen = {}
+    # The same upload of three coffees, split over three batches: the store held two
+    # when the upload first met the fingerprint, so only the third is new
+    added = [add_new(index, store, upload_rows(make_expenses, COFFEE), seen) for _ in range(3)]
+    assert added == [0, 0, 1]
+
+
+def test_descriptions_are_compared_normalised(tmp_path, make_expenses):
+    store = open_store('csv', str(tmp_path / 'expenses.csv'))
+    store.replace(make_expenses(COFFEE))
+    index = DuplicateIndex()
+    variants = upload_rows(make_expenses, ('', '2025-01-01', 'Dining', 3.5, '  COFFEE   shop '),
+                           ('', '2025-01-01', 'Dining', 3.51, 'Coffee shop'))
+    assert index.new_rows(store, variants, {}).tolist() == [False, True]
+
+
+def test_write_made_elsewhere_rebuilds_the_index(tmp_path, make_expenses):
+    path = str(tmp_path / 'expenses.csv')
+    store = open_store('csv', path)
+    index = DuplicateIndex()
+    assert index.new_rows(store, upload_rows(make_expenses, COFFEE), {}).tolist() == [True]
+    open_store('csv', path).append(make_expenses(COFFEE))  # e.g. another worker
+    assert index.new_rows(store, upload_rows(make_expenses, COFFEE), {}).tolist() == [False]
+    assert index.rebuilds == 2
+
+
+def test_concurrent_imports_through_separate_states_store_each_row_once(tmp_path, make_expenses):
+    import threading
+
+    from state import ExpenseState
+    path = str(tmp_path / 'expenses.csv')
+    statement = upload_rows(make_expenses, *[(None, f'2025-01-{day:02d}', 'Food', day, 'Lunch') for day in range(1, 29)])
+
+    # Like two workers, or a user's state reopened after eviction: no shared in-memory state
+    def run_import():
+        state, seen = ExpenseState(open_store('csv', path)), {}
+        for start in range(0, len(statement), 4):
+            state.append_new(statement.iloc[start:start + 4], seen)
+
+    threads = [threading.Thread(target=run_import) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(open_store('csv', path).load()) == len(statement)
@@ -0,0 +1,92 @@
+import pandas as pd
+import pytest
+
+from storage import BACKENDS, DEFAULT_PATHS, filter_expenses, open_store
+
+
+@pytest.mark.parametrize('query', ['start_date=NaT', 'end_date=nat', 'start_date=2024-13-01', 'min_amount=abc'])
+def test_invalid_filters_are_a_400(make_app, query):
+    client = make_app().test_client()
+    assert client.get(f'/api/insights/summary?{query}').status_code == 400
+    assert client.get(f'/api/expenses?{query}').status_code == 400
+
+
+ROWS = [
+    ('a', '2024-12-31', 'Food', 12.5, 'Dinner'),
+    ('b', '2025-01-01', 'Food', 3.0, 'Coffee'),
+    ('c', '2025-01-15', 'Rent', 900.0, 'January'),
+    ('d', '2025-01-31', 'Travel', 45.0, 'Train'),
+    ('e', '2025-02-01', 'Food', 7.25, 'Lunch'),
+    ('f', '2025-02-28', 'Rent', 900.0, 'February'),
+    ('g', '2025-03-01', 'Travel', 3.0, 'Bus'),
+]
+FILTERS = [
+    {},
+    {'start_date': pd.Timestamp('2025-01-01'), 'end_date': pd.Timestamp('2025-01-31')},
+    {'start_date': pd.Timestamp('2025-02-01')},
+    {'end_date': pd.Timestamp('2024-12-31')},
+    {'categories': ['Food', 'Travel']},
+    {'min_amount': 3.0, 'max_amount': 45.0},
+    {'categories': ['Rent'], 'start_date': pd.Timestamp('2025-02-01'), 'min_amount': 100.0},
+    {'categories': ['Nothing']},
+]
+
+
+@pytest.fixture
+def stores(tmp_path, make_expenses):
+    stores = {}
+    for backend in BACKENDS:
+        store = open_store(backend, str(tmp_path / DEFAULT_PATHS[backend]))
+        store.replace(make_expenses(*ROWS[:4]))
+        store.append(make_expenses(*ROWS[4:]))  # Parquet then reads a base and a part
+        stores[backend] = store
+    return stores
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_backends_agree_on_filtered_queries(stores, make_expenses, filters):
+    expected = filter_expenses(make_expenses(*ROWS), **filters)
+    for backend, store in stores.items():
+        assert store.summary(**filters) == {'total': pytest.approx(expected['amount'].sum()),
+                                            'count': len(expected)}, backend
+        assert store.totals_by_category(**filters) == pytest.approx(
+            expected.groupby('category')['amount'].sum().to_dict()), backend
+        assert store.totals_by_month(**filters) == pytest.approx(
+            expected.groupby(expected['date'].dt.strftime('%Y-%m'))['amount'].sum().to_dict()), backend
+        for sort, descending in (('date', False), ('amount', True)):
+            page = store.page(sort=sort, descending=descending, limit=3, **filters)
+            ordered = expected.sort_values([sort, 'id'], ascending=not descending)
+            assert list(page['id']) == list(ordered['id'][:3]), (backend, sort)
+
+
+def test_migrate_round_trips_through_every_backend(tmp_path, make_expenses, capsys):
+    from storage.__main__ import main
+    source = open_store('csv', str(tmp_path / 'source.csv'))
+    source.replace(make_expenses(*ROWS))
+    path = source.path
+    for backend, dest in (('sqlite', 'expenses.db'), ('parquet', 'expenses_parquet'), ('csv', 'back.csv')):
+        dest = str(tmp_path / dest)
+        assert main(['migrate', '--from', source.name, '--source', path, '--to', backend, '--dest', dest]) == 0
+        assert f'Migrated {len(ROWS)} expenses' in capsys.readouterr().out
+        source, path = open_store(backend, dest), dest
+    pd.testing.assert_frame_equal(source.load().sort_values('id', ignore_index=True),
+                                  make_expenses(*ROWS), check_dtype=False)
+
+
+def test_parquet_query_retries_after_a_compaction_removed_its_files(tmp_path, make_expenses, monkeypatch):
+    store = open_store('parquet', str(tmp_path / 'expenses_parquet'))
+    store.replace(make_expenses(*ROWS[:4]))
+    store.append(make_expenses(*ROWS[4:]))
+    listed = store._dataset
+
+    # Lists the files, then lets two compactions by another worker remove them
+    def stale_dataset():
+        monkeypatch.setattr(store, '_dataset', listed)
+        dataset = listed()
+        other = open_store('parquet', store.path)
+        for row in ROWS[:2]:
+            other.append(make_expenses((row[0] + '2', *row[1:])))
+            other.compact(force=True)
+        return dataset
+    monkeypatch.setattr(store, '_dataset', stale_dataset)
+    assert store.summary()['count'] == len(ROWS) + 2
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from aggregates import ExpenseAggregates
+from forecasting import MIN_MONTHS_FOR_TREND, ForecastEngine, fit_linear_trends, forecast_series, monthly_matrix
+from storage import open_store
+
+
+def test_linear_trends_match_polyfit_per_row():
+    series = np.random.default_rng(0).uniform(0, 500, size=(6, 9))
+    intercepts, slopes = fit_linear_trends(series)
+    for row, intercept, slope in zip(series, intercepts, slopes):
+        expected_slope, expected_intercept = np.polyfit(np.arange(len(row)), row, 1)
+        assert slope == pytest.approx(expected_slope)
+        assert intercept == pytest.approx(expected_intercept)
+
+
+def test_too_few_months_fall_back_to_the_average():
+    series = np.array([[10.0, 30.0], [0.0, 4.0]])
+    assert series.shape[1] < MIN_MONTHS_FOR_TREND
+    forecasts, method = forecast_series(series, 3)
+    assert method == 'average'
+    assert forecasts.tolist() == [[20.0, 20.0, 20.0], [2.0, 2.0, 2.0]]
+
+    forecasts, method = forecast_series(np.array([[10.0, 20.0, 30.0], [30.0, 10.0, 0.0]]), 2)
+    assert method == 'linear_trend'
+    assert forecasts[0].tolist() == pytest.approx([40.0, 50.0])
+    assert forecasts[1].tolist() == [0.0, 0.0]  # Falling trend clipped at zero
+
+
+def test_months_without_expenses_are_filled_with_zero():
+    categories, months, matrix = monthly_matrix({('Food', '2024-11'): 5.0, ('Rent', '2025-02'): 100.0,
+                                                 ('Food', '2025-02'): 7.0})
+    assert categories == ['Food', 'Rent']
+    assert months.tolist() == ['2024-11', '2024-12', '2025-01', '2025-02']
+    assert matrix.tolist() == [[5.0, 0.0, 0.0, 7.0], [0.0, 0.0, 0.0, 100.0]]
+
+
+def test_forecast_is_fitted_once_per_data_version(tmp_path, make_expenses):
+    store = open_store('csv', str(tmp_path / 'expenses.csv'))
+    store.replace(make_expenses(('a', '2025-01-05', 'Food', 10.0, 'x'), ('b', '2025-02-05', 'Food', 20.0, 'x'),
+                                ('c', '2025-03-05', 'Food', 30.0, 'x')))
+    engine = ForecastEngine(ExpenseAggregates())
+    first = engine.forecast(store, horizon=2)
+    assert first['months'] == ['2025-04', '2025-05']
+    assert first['total'] == pytest.approx([40.0, 50.0])
+    assert engine.forecast(store, horizon=2) is first
+    assert engine.fits == 1
+    engine.forecast(store, horizon=1)
+    assert engine.fits == 2  # Each horizon is fitted once
+
+    store.append(make_expenses(('d', '2025-04-05', 'Food', 40.0, 'x')))
+    assert engine.forecast(store, horizon=2)['months'] == ['2025-05', '2025-06']
+    assert engine.fits == 3
+
+
+@pytest.mark.parametrize('months', ['0', '25', '-1', '2.5', 'three'])
+def test_forecast_months_out_of_range_is_a_400(make_app, months):
+    response = make_app().test_client().get(f'/api/predict/forecast?months={months}')
+    assert response.status_code == 400
+    assert 'months' in response.get_json()['error']
+
+
+def test_forecast_endpoint(make_app):
+    client = make_app().test_client()
+    for month, amount in (('01', 10), ('02', 20), ('03', 30)):
+        client.post('/api/expenses', json={'date': f'2025-{month}-10', 'category': 'Food', 'amount': amount})
+    body = client.get('/api/predict/forecast?months=24').get_json()
+    assert (body['method'], body['history_months'], len(body['total'])) == ('linear_trend', 3, 24)
+    assert body['by_category']['Food'][:2] == [40.0, 50.0]
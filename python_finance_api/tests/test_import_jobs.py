@@ -0,0 +1,110 @@
+import io
+import os
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+STATEMENT = (b'Date,Description,Amount\n'
+             b'2025-01-01,Coffee shop,3.50\n'
+             b'2025-01-01,Coffee shop,3.50\n'
+             b'2025-01-02T09:30:00+01:00,Train ticket,12\n'
+             b'not a date,Broken,1\n')
+
+
+def upload(client, data, **kwargs):
+    response = client.post('/api/expenses/upload_csv', content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(data), 'statement.csv')}, **kwargs)
+    response.close()  # Lets the app record the request
+    return response
+
+
+# Polls the job's status URL until the import has finished
+def wait_for_job(client, url, timeout=10, **kwargs):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(url, **kwargs).get_json()
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.02)
+    pytest.fail(f'import job {url} did not finish')
+
+
+def test_upload_runs_as_a_background_job(make_app):
+    client = make_app().test_client()
+    response = upload(client, STATEMENT)
+    assert response.status_code == 202
+    body = response.get_json()
+    assert response.headers['Location'].endswith(f'/api/import_jobs/{body["job_id"]}')
+    assert body['status'] in ('queued', 'running', 'completed')
+
+    job = wait_for_job(client, response.headers['Location'])
+    assert job['status'] == 'completed'
+    assert job['progress']['percent'] == 100.0
+    assert (job['progress']['imported_count'], job['progress']['failed_count']) == (3, 1)
+    expenses = client.get('/api/expenses').get_json()
+    assert sorted(e['date'] for e in expenses) == ['2025-01-01', '2025-01-01', '2025-01-02']
+
+
+def test_uploading_the_same_statement_again_imports_nothing(make_app):
+    client = make_app().test_client()
+    wait_for_job(client, upload(client, STATEMENT).headers['Location'])
+    job = wait_for_job(client, upload(client, STATEMENT).headers['Location'])
+    assert (job['progress']['imported_count'], job['progress']['duplicate_count']) == (0, 3)
+    assert client.get('/api/insights/summary').get_json()['count'] == 3
+
+
+def test_upload_without_a_required_column_is_rejected_up_front(make_app, tmp_path):
+    client = make_app().test_client()
+    response = upload(client, b'Date,Description\n2025-01-01,Coffee\n')
+    assert response.status_code == 400
+    assert 'amount' in response.get_json()['error']
+    assert not list((tmp_path / 'import_jobs').iterdir())  # Nothing spooled or queued
+
+
+def test_upload_with_repeated_columns_and_ragged_rows_completes(make_app):
+    client = make_app().test_client()
+    response = upload(client, b'Date,Amount,Description,Amount\n2025-01-01,5,Lunch,1\n2025-01-02,6,Bus,1,2\n')
+    assert response.status_code == 202
+    job = wait_for_job(client, response.headers['Location'])
+    assert job['status'] == 'completed'
+    assert (job['progress']['imported_count'], job['progress']['failed_count']) == (1, 1)
+
+
+@pytest.mark.parametrize('job_id', ['0' * 32, 'not-a-job', '..%2f..%2fexpenses'])
+def test_unknown_job_is_a_404(make_app, job_id):
+    assert make_app().test_client().get(f'/api/import_jobs/{job_id}').status_code == 404
+
+
+def orphan_job(tmp_path, **changes):
+    import json
+    import uuid
+
+    from jobs import ImportJobs
+    jobs = ImportJobs(str(tmp_path / 'jobs'))
+    job = {'id': uuid.uuid4().hex, 'owner': None, 'status': 'running', 'created_at': '2025-01-01T00:00:00+00:00',
+           'updated_at': datetime.now(timezone.utc).isoformat(), 'error': None,
+           'worker': {'host': socket.gethostname(), 'pid': os.getpid()}, **changes}
+    (tmp_path / 'jobs' / f'{job["id"]}.json').write_text(json.dumps(job))
+    return jobs.get(job['id'])
+
+
+def test_job_of_a_live_worker_keeps_its_status(tmp_path):
+    assert orphan_job(tmp_path)['status'] == 'running'
+
+
+def test_job_whose_worker_died_is_reported_failed(tmp_path):
+    import subprocess
+    finished = subprocess.Popen(['true'])
+    finished.wait()  # Its pid now belongs to no process
+    job = orphan_job(tmp_path, status='queued', worker={'host': socket.gethostname(), 'pid': finished.pid})
+    assert job['status'] == 'failed' and 'stopped' in job['error']
+
+
+def test_running_job_without_recent_progress_is_reported_failed(tmp_path):
+    from jobs import JOB_STALE_SECONDS
+    stale = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS + 60)
+    assert orphan_job(tmp_path, updated_at=stale.isoformat())['status'] == 'failed'
+    # Queued jobs wait for a free import thread, however long that takes
+    assert orphan_job(tmp_path, status='queued', updated_at=stale.isoformat())['status'] == 'queued'
@@ -0,0 +1,91 @@
+import io
+
+import pandas as pd
+
+from importer import DEFAULT_CATEGORY, import_expenses_csv, parse_dates, read_header, validate_chunk
+
+
+# Imports `data` (bytes) batch by batch; returns (result, committed rows)
+def run_import(data, **kwargs):
+    batches = []
+    result = import_expenses_csv(io.BytesIO(data), batches.append, **kwargs)
+    committed = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+    return result, committed
+
+
+def test_repeated_column_names_are_made_unique():
+    header, actual_cols = read_header(io.StringIO('Date,Amount,Memo,Amount,Amount\n'))
+    assert header == ['Date', 'Amount', 'Memo', 'Amount.1', 'Amount.2']
+    assert actual_cols == {'date_col': 'Date', 'desc_col': 'Memo', 'amount_col': 'Amount'}
+
+    result, committed = run_import(b'Date,Amount,Memo,Amount\n2025-01-01,5,Lunch,99\n')
+    assert result['imported_count'] == 1
+    assert list(committed['amount']) == [5.0]
+
+
+def test_rows_with_extra_fields_are_counted_as_failed():
+    data = (b'Date,Description,Amount\n'
+            b'2025-01-01,Coffee,3\n'
+            b'2025-01-02,Lunch,4,extra\n'  # First row of the second chunk
+            b'\n'
+            b'2025-01-03,"Two\nlines",5,x,y\n'
+            b'2025-01-04,Short\n'  # Missing fields are empty: a failed amount
+            b'2025-01-05,Bus,6\n')
+    result, committed = run_import(data, chunk_rows=1)
+    assert result['imported_count'] == 2
+    assert list(committed['date'].dt.day) == [1, 5]
+    assert [(f['row_number'], f['reason']) for f in result['failed_rows_details']] == [
+        (3, 'Error parsing row: expected 3 fields, saw 4.'),
+        (5, 'Error parsing row: expected 3 fields, saw 5.'),
+        (7, 'Error parsing row: invalid amount.'),
+    ]
+    assert result['failed_rows_details'][0]['data'] == {
+        'Date': '2025-01-02', 'Description': 'Lunch', 'Amount': '4', 'extra_fields': ['extra']}
+
+
+def test_validate_chunk_reports_why_each_row_failed():
+    chunk = pd.DataFrame({'Date': ['2025-01-01', 'soon', '2025-01-03', '2025-01-04', '2025-01-05', '2025-01-06'],
+                          'Amount': ['3.5', '1', 'abc', '-2', '0', 'inf'],
+                          'Memo': ['Coffee', 'x', 'y', 'Refund', 'z', 'w']},
+                         index=range(2, 8))
+    new_expenses, reasons = validate_chunk(chunk, {'date_col': 'Date', 'amount_col': 'Amount', 'desc_col': 'Memo'})
+    assert list(reasons) == ['', 'Error parsing row: invalid date.', 'Error parsing row: invalid amount.',
+                             'Amount must be a positive value for an expense.',
+                             'Amount must be a positive value for an expense.', 'Error parsing row: invalid amount.']
+    assert list(reasons.index) == list(chunk.index)
+    assert new_expenses[['amount', 'description', 'category']].to_dict('records') == [
+        {'amount': 3.5, 'description': 'Coffee', 'category': DEFAULT_CATEGORY}]
+
+
+def test_failed_rows_echoed_back_are_capped():
+    data = b'Date,Amount\n' + b'bad,1\n' * 7 + b'2025-01-01,2\n'
+    result, _ = run_import(data, chunk_rows=3, max_reported_failures=5)
+    assert (result['imported_count'], result['failed_count']) == (1, 7)
+    assert [f['row_number'] for f in result['failed_rows_details']] == [2, 3, 4, 5, 6]
+    assert result['failed_rows_truncated']
+
+    result, _ = run_import(data, max_reported_failures=7)
+    assert len(result['failed_rows_details']) == 7
+    assert not result['failed_rows_truncated']
+
+
+def test_row_numbers_continue_across_chunks():
+    rows = [b'2025-01-%02d,%d' % (day, day) if day % 3 else b'bad,%d' % day for day in range(1, 11)]
+    result, committed = run_import(b'Date,Amount\n' + b'\n'.join(rows) + b'\n', chunk_rows=4)
+    assert [f['row_number'] for f in result['failed_rows_details']] == [4, 7, 10]  # Days 3, 6 and 9
+    assert [f['data']['Amount'] for f in result['failed_rows_details']] == ['3', '6', '9']
+    assert list(committed['amount']) == [1.0, 2.0, 4.0, 5.0, 7.0, 8.0, 10.0]
+
+
+def test_dates_keep_their_written_calendar_day_whatever_the_offset():
+    values = pd.Series(['2025-01-01T00:30:00+01:00', '2025-01-31T23:30:00-08:00', '2025-02-01 10:00 UTC',
+                        '2025-02-02T08:00:00Z', '2025-02-03'])
+    assert list(parse_dates(values)) == [pd.Timestamp('2025-01-01 00:30'), pd.Timestamp('2025-01-31 23:30'),
+                                         pd.Timestamp('2025-02-01 10:00'), pd.Timestamp('2025-02-02 08:00'),
+                                         pd.Timestamp('2025-02-03')]
+
+    # Offsets mixed within one batch don't fail the import
+    result, committed = run_import(b'Date,Amount\n2025-01-01T00:30:00+01:00,1\n2025-03-01T23:00:00-05:00,2\n'
+                                   b'03/02/2025,3\n')
+    assert result['failed_count'] == 0
+    assert list(committed['date'].dt.strftime('%Y-%m-%d')) == ['2025-01-01', '2025-03-01', '2025-03-02']
@@ -0,0 +1,87 @@
+import json
+import os
+import time
+
+import metrics
+from metrics import LATENCY_BUCKETS, RequestMetrics
+
+
+# Parses Prometheus text into {'name{labels}': value}, skipping comments
+def samples(text):
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            key, value = line.rsplit(' ', 1)
+            result[key] = float(value)
+    return result
+
+
+def test_metrics_endpoint_reports_counters_and_cumulative_buckets(make_app):
+    client = make_app().test_client()
+    for _ in range(3):
+        # Requests are recorded once their response has been sent and closed
+        with client.get('/api/health') as response:
+            assert response.status_code == 200
+
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE finance_api_requests_total counter' in text
+    assert '# TYPE finance_api_request_duration_seconds histogram' in text
+
+    values = samples(text)
+    assert values['finance_api_requests_total{route="/api/health",method="GET",status="200"}'] == 3
+    labels = 'route="/api/health",method="GET"'
+    buckets = [values[f'finance_api_request_duration_seconds_bucket{{{labels},le="{bound!r}"}}']
+               for bound in LATENCY_BUCKETS]
+    buckets.append(values[f'finance_api_request_duration_seconds_bucket{{{labels},le="+Inf"}}'])
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == values[f'finance_api_request_duration_seconds_count{{{labels}}}'] == 3
+    assert values[f'finance_api_request_duration_seconds_sum{{{labels}}}'] > 0
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = RequestMetrics()
+    for seconds in (0.0005, 0.003, 0.003, 0.2, 60):
+        registry.observe('/r', 'GET', 200, seconds, {'store': seconds / 2})
+
+    values = samples(registry.render())
+    labels = 'route="/r",method="GET"'
+    assert values[f'finance_api_request_duration_seconds_bucket{{{labels},le="0.001"}}'] == 1
+    assert values[f'finance_api_request_duration_seconds_bucket{{{labels},le="0.005"}}'] == 3
+    assert values[f'finance_api_request_duration_seconds_bucket{{{labels},le="0.25"}}'] == 4
+    assert values[f'finance_api_request_duration_seconds_bucket{{{labels},le="30.0"}}'] == 4
+    assert values[f'finance_api_request_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 5
+    assert values['finance_api_request_phase_seconds_count{route="/r",phase="store"}'] == 5
+
+
+def test_snapshots_of_other_processes_are_merged(tmp_path):
+    other = RequestMetrics()
+    other.observe('/r', 'GET', 200, 0.002, {})
+    other.observe('/r', 'GET', 500, 0.5, {})
+    (tmp_path / 'metrics-1.json').write_text(json.dumps(other.snapshot()))
+
+    registry = RequestMetrics(str(tmp_path))
+    registry.observe('/r', 'GET', 200, 0.002, {})
+
+    values = samples(registry.render())
+    assert values['finance_api_requests_total{route="/r",method="GET",status="200"}'] == 2
+    assert values['finance_api_requests_total{route="/r",method="GET",status="500"}'] == 1
+    labels = 'route="/r",method="GET"'
+    assert values[f'finance_api_request_duration_seconds_bucket{{{labels},le="0.0025"}}'] == 2
+    assert values[f'finance_api_request_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 3
+    assert len(list(tmp_path.glob('metrics-*.json'))) == 2
+
+
+def test_idle_process_flushes_its_last_observations(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'SNAPSHOT_INTERVAL_SECONDS', 0.05)
+    registry = RequestMetrics(str(tmp_path))
+    registry.observe('/r', 'GET', 200, 0.01, {})
+
+    # Written without this process rendering /api/metrics itself
+    path = tmp_path / f'metrics-{os.getpid()}.json'
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert json.loads(path.read_text())['requests'] == [['/r', 'GET', '200', 1]]
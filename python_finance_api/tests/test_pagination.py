@@ -0,0 +1,89 @@
+import base64
+import json
+
+import pandas as pd
+import pytest
+
+from serializers import decode_cursor, encode_cursor
+from storage import BACKENDS, keyset_slice
+
+ROWS = [
+    ('a', '2025-01-01', 'Food', 5.0, 'x'),
+    ('b', '2025-01-01', 'Food', 7.0, 'x'),
+    ('c', '2025-01-02', 'Rent', 5.0, 'x'),
+    ('d', '2025-01-03', 'Food', 1.0, 'x'),
+    ('e', '2025-01-03', 'Food', 7.0, 'x'),
+]
+
+
+def test_keyset_slice_breaks_ties_by_id(make_expenses):
+    df = make_expenses(*ROWS).sort_values(['date', 'id'])
+    after = (pd.Timestamp('2025-01-01'), 'a')
+    assert list(keyset_slice(df, 'date', after=after)['id']) == ['b', 'c', 'd', 'e']
+    assert list(keyset_slice(df, 'date', after=after, limit=2)['id']) == ['b', 'c']
+    descending = df.iloc[::-1]
+    after = (pd.Timestamp('2025-01-03'), 'e')
+    assert list(keyset_slice(descending, 'date', descending=True, after=after)['id']) == ['d', 'c', 'b', 'a']
+
+
+@pytest.mark.parametrize('sort', ['date', 'amount'])
+def test_cursor_round_trip(make_expenses, sort):
+    row = make_expenses(*ROWS).iloc[2]
+    value, last_id = decode_cursor(encode_cursor(row, sort), sort)
+    assert last_id == 'c'
+    assert value == (pd.Timestamp('2025-01-02') if sort == 'date' else 5.0)
+
+
+# Encodes a cursor's JSON the way encode_cursor does, with any value in it
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('token', ['', 'not base64!', raw_cursor([]), raw_cursor([1, 2]),
+                                   raw_cursor(['2025-01-01', 1]), raw_cursor(['', 'a']),
+                                   raw_cursor(['NaT', 'a']), raw_cursor(['2025-01-01T00:00:00+02:00', 'a']),
+                                   raw_cursor(['2025-01-01 10:00', 'a'])])
+def test_invalid_cursors_are_rejected(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token, 'date')
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), True, '5'])
+def test_invalid_amount_cursors_are_rejected(value):
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor([value, 'a']), 'amount')
+
+
+def test_amount_cursor_rejects_a_date_value():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(pd.Series({'date': pd.Timestamp('2025-01-01'), 'id': 'a'}), 'date'), 'amount')
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('sort', ['date', '-date', 'amount', '-amount'])
+def test_paging_through_the_api_returns_every_expense_once(make_app, make_expenses, backend, sort):
+    app = make_app(backend)
+    with app.app_context():
+        from app import get_state
+        get_state().replace(make_expenses(*ROWS))
+    client = app.test_client()
+    ids, cursor = [], None
+    while True:
+        response = client.get(f'/api/expenses?limit=2&sort={sort}' + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        page = response.get_json()
+        ids += [e['id'] for e in page['expenses']]
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    column = sort.lstrip('-')
+    expected = make_expenses(*ROWS).sort_values([column, 'id'], ascending=not sort.startswith('-'))
+    assert ids == list(expected['id'])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('cursor', ['junk', raw_cursor(['', 'a']), raw_cursor(['2025-01-01T00:00:00+02:00', 'a'])])
+def test_bad_cursor_is_a_400(make_app, backend, cursor):
+    client = make_app(backend).test_client()
+    assert client.post('/api/expenses', json={'date': '2025-01-01', 'category': 'Food', 'amount': 5}).status_code == 201
+    assert client.get(f'/api/expenses?cursor={cursor}').status_code == 400
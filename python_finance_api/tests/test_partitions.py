@@ -0,0 +1,121 @@
+import io
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from auth import sign_user_token
+from state import UserStates
+from storage import UserPartitions, base, split_expenses, validate_user_id
+
+SECRET = 'test-secret'
+
+
+def auth(user_id):
+    return {'Authorization': f'Bearer {sign_user_token(user_id, SECRET)}'}
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app(USER_PARTITIONS=True, AUTH_SECRET=SECRET, PARTITION_SHARDED=True).test_client()
+
+
+@pytest.mark.parametrize('user_id', ['', '../x', 'a/b', 'a' * 65, 'é'])
+def test_unusable_user_ids_are_rejected(user_id):
+    with pytest.raises(ValueError):
+        validate_user_id(user_id)
+
+
+def test_sharded_layout(tmp_path):
+    partitions = UserPartitions(str(tmp_path), 'csv', sharded=True)
+    parts = os.path.relpath(partitions.path(42), tmp_path).split(os.sep)
+    assert parts[-1] == '42.csv' and [len(part) for part in parts[:-1]] == [2, 2]
+    partitions.open('42').load()
+    partitions.open('7').load()
+    assert sorted(partitions.user_ids()) == ['42', '7']
+
+
+def test_split_gives_each_user_their_rows(tmp_path, make_expenses):
+    partitions = UserPartitions(str(tmp_path), 'sqlite')
+    df = make_expenses(('a', '2025-01-01', 'Food', 1, 'x'), ('b', '2025-01-02', 'Food', 2, 'y'),
+                       ('c', '2025-01-03', 'Food', 3, 'z'))
+    assert split_expenses(df, pd.Series(['1', '2', '1']), partitions) == {'1': 2, '2': 1}
+    assert list(partitions.open('1').load()['id']) == ['a', 'c']
+    with pytest.raises(ValueError):
+        split_expenses(df, pd.Series(['1', '../2', '1']), partitions)
+
+
+def test_least_recently_used_states_are_dropped(tmp_path):
+    states = UserStates(UserPartitions(str(tmp_path)), max_open=2)
+    first = states.get('a')
+    states.get('b')
+    assert states.get('a') is first
+    states.get('c')  # Drops 'b', the least recently used
+    assert states.get('a') is first
+    assert states.stats()['open'] == 2
+    assert states.get('b') is not None and states.stats()['opened'] == 4
+
+
+def test_unset_limits_take_the_module_defaults(make_app, monkeypatch):
+    from app import default_config, get_import_jobs, get_user_states
+    from jobs import IMPORT_WORKERS
+    from state import MAX_OPEN_PARTITIONS
+    monkeypatch.delenv('EXPENSE_IMPORT_WORKERS', raising=False)
+    monkeypatch.setenv('EXPENSE_MAX_OPEN_PARTITIONS', '3')
+    assert (default_config()['IMPORT_WORKERS'], default_config()['MAX_OPEN_PARTITIONS']) == (None, 3)
+    app = make_app(USER_PARTITIONS=True, AUTH_SECRET='s', IMPORT_WORKERS=None, MAX_OPEN_PARTITIONS=None)
+    with app.app_context():
+        assert (get_import_jobs().max_workers, get_user_states().max_open) == (IMPORT_WORKERS, MAX_OPEN_PARTITIONS)
+
+
+def test_file_locks_are_not_kept_after_use(tmp_path):
+    for user_id in range(50):
+        with base.expense_file_lock(str(tmp_path / f'{user_id}.csv')):
+            pass
+    assert not base._process_locks
+
+
+def test_partitioning_needs_a_secret(make_app):
+    with pytest.raises(RuntimeError):
+        make_app(USER_PARTITIONS=True, AUTH_SECRET=None)
+
+
+@pytest.mark.parametrize('headers', [{}, {'Authorization': 'Bearer x.é'}, auth('../etc')])
+def test_requests_without_a_valid_user_are_a_401(client, headers):
+    response = client.get('/api/expenses', headers=headers)
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+
+def test_public_endpoints_need_no_token(client):
+    assert client.get('/api/health').status_code == 200
+    assert client.get('/api/metrics').status_code == 200
+
+
+def test_users_only_see_their_own_expenses(client):
+    expense = {'date': '2025-01-02', 'category': 'Food', 'amount': 5, 'description': 'Lunch'}
+    assert client.post('/api/expenses', json=expense, headers=auth('1')).status_code == 201
+    assert len(client.get('/api/expenses', headers=auth('1')).get_json()) == 1
+    assert client.get('/api/expenses', headers=auth('2')).get_json() == []
+    assert client.get('/api/insights/summary', headers=auth('2')).get_json()['count'] == 0
+
+    response = client.get('/api/insights/summary', headers=auth('1'))
+    assert 'Authorization' in response.headers['Vary']
+    # One user's ETag doesn't revalidate another user's response
+    other = client.get('/api/insights/summary', headers={**auth('2'), 'If-None-Match': response.headers['ETag']})
+    assert other.status_code == 200
+
+
+def test_import_jobs_belong_to_their_user(client):
+    response = client.post('/api/expenses/upload_csv', headers=auth('1'), content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(b'Date,Description,Amount\n2025-01-01,Coffee,3.5\n'), 's.csv')})
+    response.close()
+    url = response.headers['Location']
+    deadline = time.monotonic() + 10
+    while client.get(url, headers=auth('1')).get_json()['status'] not in ('completed', 'failed'):
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert client.get(url, headers=auth('2')).status_code == 404
+    assert client.get('/api/insights/summary', headers=auth('1')).get_json()['count'] == 1
+    assert client.get('/api/insights/summary', headers=auth('2')).get_json()['count'] == 0